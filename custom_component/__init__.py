@@ -9,6 +9,7 @@ from homeassistant.const import (
     CONF_HOST, CONF_PORT, CONF_USERNAME, CONF_PASSWORD,
     CONF_SENSORS, CONF_SWITCHES, EVENT_HOMEASSISTANT_STOP)
 from homeassistant.helpers import discovery
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.dispatcher import (
     async_dispatcher_send)
@@ -18,6 +19,14 @@ from homeassistant.util.dt import utcnow
 _LOGGER = logging.getLogger(__name__)
 
 CONF_MAXCONN = 'maxconn'
+CONF_PUSH = 'push'
+CONF_CACHE = 'cache'
+CONF_AUTH = 'auth'
+CONF_METRICS = 'metrics'
+CONF_GROW = 'grow'
+CONF_LAZY = 'lazy'
+
+CACHE_FILE = 'tvheadend_grids.db'
 
 DATA_TVH = 'tvheadend'
 DEFAULT_PARTNER = False
@@ -27,20 +36,30 @@ HEAT_ENTITY = 'heat'
 USER_ENTITY = 'user'
 
 TVH_SCAN_INTERVAL = timedelta(seconds=30)
+TVH_GRID_SCAN_INTERVAL = timedelta(hours=1)
 
-SIGNAL_UPDATE_TVH = 'tvh_update'
+SIGNAL_UPDATE_TVH_STREAM = 'tvh_update_{}'
 
 SERVICE_SERVICE_SET = 'service_set'
 SERVICE_SERVICE_SWITCH = 'service_switch'
 
 ATTR_TARGET_INDEX = 'index'
 ATTR_TARGET_SERVICE = 'target'
+ATTR_STREAMS = 'streams'
 
 VALID_TARGET_SERVICE = vol.All(vol.Coerce(int), vol.Clamp(min=0, max=100))
+VALID_TARGET_INDEX = vol.All(vol.Coerce(int), vol.Range(min=0))
+
+STREAM_TARGET_SCHEMA = vol.Schema({
+    vol.Required(ATTR_TARGET_INDEX): VALID_TARGET_INDEX,
+    vol.Optional(ATTR_TARGET_SERVICE): cv.string,
+    })
 
 SERVICE_TVH_SCHEMA = vol.Schema({
-    ATTR_TARGET_INDEX: cv.string,
+    ATTR_TARGET_INDEX: VALID_TARGET_INDEX,
     ATTR_TARGET_SERVICE: cv.string,
+    vol.Optional(ATTR_STREAMS): vol.All(
+        cv.ensure_list, [STREAM_TARGET_SCHEMA]),
     })
 
 CONFIG_SCHEMA = vol.Schema({
@@ -50,6 +69,12 @@ CONFIG_SCHEMA = vol.Schema({
         vol.Required(CONF_MAXCONN): cv.string,
         vol.Optional(CONF_USERNAME): cv.string,
         vol.Optional(CONF_PASSWORD): cv.string,
+        vol.Optional(CONF_PUSH, default=True): cv.boolean,
+        vol.Optional(CONF_CACHE, default=False): cv.boolean,
+        vol.Optional(CONF_AUTH, default='basic'): vol.In(['basic', 'digest']),
+        vol.Optional(CONF_METRICS, default=False): cv.boolean,
+        vol.Optional(CONF_GROW, default=False): cv.boolean,
+        vol.Optional(CONF_LAZY, default=True): cv.boolean,
     }),
 }, extra=vol.ALLOW_EXTRA)
 
@@ -64,33 +89,65 @@ async def async_setup(hass, config):
     user = conf.get(CONF_USERNAME)
     password = conf.get(CONF_PASSWORD)
     maxconn = conf.get(CONF_MAXCONN)
-
-    tvh = TVHeadend(host, port, maxconn=maxconn, loop=hass.loop)
+    push = conf.get(CONF_PUSH)
+    cache_path = None
+    if conf.get(CONF_CACHE):
+        cache_path = hass.config.path(CACHE_FILE)
+
+    # Reuse Home Assistant's pooled session
+    tvh = TVHeadend(host, port, usr=user, pwd=password, maxconn=maxconn,
+                    loop=hass.loop, cache_path=cache_path,
+                    session=async_get_clientsession(hass),
+                    auth=conf.get(CONF_AUTH), metrics=conf.get(CONF_METRICS),
+                    grow_slots=conf.get(CONF_GROW))
 
     hass.data[DATA_TVH] = tvh
 
-    # Authenticate, build sensors
-    success = await tvh.start()
+    # Authenticate, build sensors.  A lazy start loads grids in the
+    # background, entities stay unavailable until they are in.
+    lazy = conf.get(CONF_LAZY)
+    success = await tvh.start(lazy=lazy)
     if not success:
         # Authentication failed, cannot continue
         return False
 
     async def async_update_tvh_data(now):
         """Update data from tvh in TVH_SCAN_INTERVAL."""
-        await tvh.fetch_subscription_list()
-        async_dispatcher_send(hass, SIGNAL_UPDATE_TVH)
+        # Push notifications keep data current, only poll without them.
+        # Changed stream slots are signalled through the update callback.
+        if not tvh.push_active:
+            await tvh.fetch_subscription_list()
+            await tvh.fetch_input_list()
+        # Only channels without a recent guide are fetched
+        await tvh.fetch_stream_epg()
 
         async_track_point_in_utc_time(
             hass, async_update_tvh_data, utcnow() + TVH_SCAN_INTERVAL)
 
+    async def async_update_tvh_grids(now):
+        """Pick up channel and service changes in TVH_GRID_SCAN_INTERVAL."""
+        # Push notifications patch the grids as they change
+        if now is not None and not tvh.push_active:
+            await tvh.refresh_changed_grids()
+
+        async_track_point_in_utc_time(
+            hass, async_update_tvh_grids, utcnow() + TVH_GRID_SCAN_INTERVAL)
+
     @callback
     def force_update_tvh_data(msg):
-        """Force update of all data"""
-        _LOGGER.debug('TVHeadend Force Update Callback fired.')
-        async_dispatcher_send(hass, SIGNAL_UPDATE_TVH)
+        """Update entities of a changed stream slot"""
+        _LOGGER.debug('TVHeadend update callback fired for slot %s.', msg)
+        async_dispatcher_send(hass, SIGNAL_UPDATE_TVH_STREAM.format(msg))
 
-    await async_update_tvh_data(None)
     tvh.add_update_callback(force_update_tvh_data)
+    if lazy:
+        hass.async_create_task(async_update_tvh_data(None))
+    else:
+        await async_update_tvh_data(None)
+    await async_update_tvh_grids(None)
+
+    if push:
+        await tvh.start_notifications()
 
     # Load sub components
     sensors = []
@@ -107,6 +164,7 @@ async def async_setup(hass, config):
     hass.async_create_task(discovery.async_load_platform(
         hass, 'sensor', DOMAIN, {
             CONF_SENSORS: sensors,
+            CONF_METRICS: conf.get(CONF_METRICS),
         }, config))
 
     hass.async_create_task(discovery.async_load_platform(
@@ -118,10 +176,25 @@ async def async_setup(hass, config):
         """Handle tvh service calls."""
         params = service.data.copy()
 
-        index = int(params.pop(ATTR_TARGET_INDEX, None))
-        target = params.pop(ATTR_TARGET_SERVICE, None)
-
-        await tvh.stream_list[index].change_service(target.upper())
+        targets = list(params.pop(ATTR_STREAMS, []))
+        if ATTR_TARGET_INDEX in params:
+            targets.append({
+                ATTR_TARGET_INDEX: params.pop(ATTR_TARGET_INDEX),
+                ATTR_TARGET_SERVICE: params.pop(ATTR_TARGET_SERVICE, None),
+                })
+
+        # Last target given for a stream wins
+        mapping = {}
+        for stream in targets:
+            index = int(stream[ATTR_TARGET_INDEX])
+            target = stream.get(ATTR_TARGET_SERVICE)
+            if index in mapping:
+                _LOGGER.warning('Stream %s given more than once, dropping '
+                                'target %s.', index, mapping[index])
+            mapping[index] = target.upper() if target else None
+
+        # All streams switch in a single save round-trip
+        await tvh.change_services(mapping)
 
     # Register services
     hass.services.async_register(
@@ -5,12 +5,24 @@ from homeassistant.const import (EVENT_STATE_CHANGED, ATTR_ENTITY_ID)
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity import Entity
-import homeassistant.components.input_select as input_select
+from homeassistant.helpers.event import async_call_later
 from . import (
-    CONF_SENSORS, DATA_TVH, SIGNAL_UPDATE_TVH)
+    CONF_SENSORS, CONF_METRICS, DATA_TVH, SIGNAL_UPDATE_TVH_STREAM)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Diagnostic sensors: key, name, unit, icon
+METRIC_SENSORS = [
+    ('poll_duration', 'Poll Duration', 's', 'mdi:timer'),
+    ('switch_duration', 'Service Switch Duration', 's', 'mdi:timer'),
+    ('request_errors', 'Request Errors', 'errors', 'mdi:alert-circle'),
+    ('stream_churn', 'Stream Churn', 'streams', 'mdi:swap-horizontal'),
+    ]
+
+# Stream updates within this many seconds are pushed to the input
+# select together
+INPUT_SELECT_DEBOUNCE = 1
+
 
 async def async_setup_platform(hass, config, async_add_entities,
                                discovery_info=None):
@@ -28,6 +40,21 @@ async def async_setup_platform(hass, config, async_add_entities,
         sname = '{}_{}'.format(name, index)
         all_sensors.append(TVHSensor(hass, sname, tvh.stream_list[index]))
 
+    all_sensors.append(TVHTunerSensor(tvh))
+
+    @callback
+    def async_add_slot(index):
+        """Add a sensor for a slot added on overflow."""
+        sname = '{}_{}'.format(name, index)
+        async_add_entities(
+            [TVHSensor(hass, sname, tvh.stream_list[index])], True)
+
+    tvh.add_slot_callback(async_add_slot)
+
+    if discovery_info.get(CONF_METRICS):
+        for metric in METRIC_SENSORS:
+            all_sensors.append(TVHMetricSensor(tvh, metric))
+
     async_add_entities(all_sensors, True)
 
 
@@ -39,13 +66,18 @@ class TVHSensor(Entity):
         self.hass = hass
         self._stream = stream
         self._name = name
+        self._index = self._name.split('_')[1]
         self._state = self._stream.channel_name
         # self._update_input_select()
         _LOGGER.debug('Setup new stream sensor: {}'.format(name))
 
-        self._input_entity = 'input_select.tv_stream_{}'.format(self._name.split('_')[1])
+        self._input_entity = 'input_select.tv_stream_{}'.format(self._index)
         self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._handle_input_select_updates)
 
+        # Options last pushed to the input select, pending push
+        self._pushed_options = None
+        self._select_unsub = None
+
     async def _handle_input_select_updates(self, event):
         """Handle state change updates for input_select"""
         entity_id = event.data.get(ATTR_ENTITY_ID)
@@ -72,7 +104,14 @@ class TVHSensor(Entity):
             self.async_schedule_update_ha_state(True)
 
         async_dispatcher_connect(
-            self.hass, SIGNAL_UPDATE_TVH, async_tvh_update)
+            self.hass, SIGNAL_UPDATE_TVH_STREAM.format(self._index),
+            async_tvh_update)
+
+    async def async_will_remove_from_hass(self):
+        """Cancel a pending input select push."""
+        if self._select_unsub is not None:
+            self._select_unsub()
+            self._select_unsub = None
 
     @property
     def name(self):
@@ -83,7 +122,7 @@ class TVHSensor(Entity):
     @property
     def available(self):
         """Return True if entity is available."""
-        return self._stream.is_active
+        return self._stream.server.ready and self._stream.is_active
 
     @property
     def icon(self):
@@ -103,45 +142,77 @@ class TVHSensor(Entity):
     async def async_update(self):
         """Update latest state"""
         self._state = self._stream.channel_name
-        await self._update_input_select(self._stream.active_service)
+        self._schedule_input_select()
 
     @property
     def device_state_attributes(self):
         """Return the state attributes."""
         state_attr = {'active_service': self._stream.active_service}
         state_attr['service_list'] = self._stream.service_name_list
+        occupancy = self._stream.occupancy()
+        state_attr['tuners'] = occupancy['inputs']
+        state_attr['shared_mux_streams'] = occupancy['shared_with']
+        bitrate = self._stream.bitrate
+        state_attr['bitrate_kbps'] = None if bitrate is None \
+            else round(bitrate / 1000)
+        state_attr['error_rate'] = self._stream.error_rate
+        current, following = self._stream.now_next()
+        state_attr['now_playing'] = current.title if current else None
+        state_attr['next_playing'] = following.title if following else None
         return state_attr
 
-    async def _update_input_select(self, option=None):
-        """Update associated input select"""
-
-        if self.hass.states.get(self._input_entity) is None:
-            _LOGGER.error("%s is not a valid input_select entity.", self._input_entity)
+    @callback
+    def _schedule_input_select(self):
+        """Push to the input select once a burst of updates settles."""
+        if self._select_unsub is not None:
+            # The pending push picks up the latest stream state
             return
-        else:
-            curr_state = self.hass.states.get(self._input_entity).state
-            # _LOGGER.debug('{}, state: {}'.format(input_entity, curr_state))
+        self._select_unsub = async_call_later(
+            self.hass, INPUT_SELECT_DEBOUNCE, self._async_push_input_select)
 
-        if not self._stream.service_name_list:
-            if curr_state == 'Inactive':
-                return
-            data = {"options": ["Inactive"], "entity_id": self._input_entity}
-        else:
-            if curr_state == option:
-                return
-            data = {"options": self._reorder_list(
-                self._stream.service_name_list, option),
-                    "entity_id": self._input_entity}
+    async def _async_push_input_select(self, now):
+        """Push pending stream state to the input select."""
+        self._select_unsub = None
+        await self._update_input_select(self._stream.active_service)
 
-        _LOGGER.debug('Update input_select with: {}'.format(data))
-        await self.hass.services.async_call(
-            input_select.DOMAIN, input_select.SERVICE_SET_OPTIONS, data)
+    async def _update_input_select(self, option=None):
+        """Update associated input select with what changed"""
+        import homeassistant.components.input_select as input_select
 
-        if option:
+        state = self.hass.states.get(self._input_entity)
+        if state is None:
+            _LOGGER.error("%s is not a valid input_select entity.", self._input_entity)
+            return
+        curr_state = state.state
+
+        options = self._stream.service_name_list
+        if not options:
+            options = ['Inactive']
+            option = None
+
+        pushed = self._pushed_options
+        if pushed is not None and \
+                list(state.attributes.get('options', pushed)) != pushed:
+            # Input select was reloaded since the last push
+            pushed = None
+
+        # Reordering alone is not a change, a new selection is made below
+        if pushed is None or set(options) != set(pushed):
+            if option:
+                options = self._reorder_list(options, option)
+            data = {"options": options, "entity_id": self._input_entity}
+            _LOGGER.debug('Update input_select with: {}'.format(data))
+            await self.hass.services.async_call(
+                input_select.DOMAIN, input_select.SERVICE_SET_OPTIONS, data,
+                blocking=True)
+            self._pushed_options = options
+            # Setting options selects the first one
+            curr_state = options[0]
+
+        if option and curr_state != option:
             data = {"option": option, "entity_id": self._input_entity}
-            if curr_state != option:
-                await self.hass.services.async_call(
-                    input_select.DOMAIN, input_select.SERVICE_SELECT_OPTION, data)
+            await self.hass.services.async_call(
+                input_select.DOMAIN, input_select.SERVICE_SELECT_OPTION, data)
 
     def _reorder_list(self, inlist, first=None):
         """Reorder given list moving specified value to index 0."""
@@ -163,3 +234,112 @@ class TVHSensor(Entity):
         else:
             _LOGGER.error("New list is longer than input, aborting.")
             return inlist
+
+
+class TVHTunerSensor(Entity):
+    """TVH tuner occupancy sensor representation."""
+
+    def __init__(self, tvh):
+        """Initialize of a TVH tuner sensor."""
+        self._tvh = tvh
+        self._state = None
+        self._attributes = {}
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return 'TVHeadend Tuners In Use'
+
+    @property
+    def available(self):
+        """Return True if entity is available."""
+        return self._tvh.ready
+
+    @property
+    def icon(self):
+        """Return the icon"""
+        return 'mdi:satellite-uplink'
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return 'tuners'
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes."""
+        return self._attributes
+
+    def update(self):
+        """Update occupancy from the last fetched inputs."""
+        occupancy = self._tvh.occupancy()
+        self._state = occupancy.pop('inputs')
+        self._attributes = occupancy
+
+
+class TVHMetricSensor(Entity):
+    """TVH diagnostic metric sensor representation."""
+
+    def __init__(self, tvh, metric):
+        """Initialize of a TVH metric sensor."""
+        self._tvh = tvh
+        self._key, self._name, self._unit, self._icon = metric
+        self._state = None
+        self._attributes = {}
+
+    @property
+    def name(self):
+        """Return the name of the metric."""
+        return 'TVHeadend {}'.format(self._name)
+
+    @property
+    def icon(self):
+        """Return the icon"""
+        return self._icon
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of measurement."""
+        return self._unit
+
+    @property
+    def state(self):
+        """Return the state of the sensor."""
+        return self._state
+
+    @property
+    def device_state_attributes(self):
+        """Return the state attributes."""
+        return self._attributes
+
+    def update(self):
+        """Update metric from the latest snapshot."""
+        snapshot = self._tvh.metrics()
+        if snapshot is None:
+            return
+
+        if self._key in ('poll_duration', 'switch_duration'):
+            name = 'poll' if self._key == 'poll_duration' \
+                else 'change_service'
+            timing = snapshot['timings'].get(name)
+            if timing is None:
+                return
+            self._state = round(timing['mean'], 3)
+            self._attributes = {'count': timing['count'],
+                                'max': round(timing['max'], 3)}
+        elif self._key == 'request_errors':
+            requests = snapshot['requests']
+            self._attributes = {
+                endpoint: stats['errors'] + stats['timeouts']
+                for endpoint, stats in requests.items()}
+            self._state = sum(self._attributes.values())
+        else:
+            counters = snapshot['counters']
+            self._attributes = counters
+            self._state = counters.get('streams_added', 0) + \
+                counters.get('streams_removed', 0)
@@ -2,7 +2,7 @@
 import logging
 
 from . import (
-    CONF_SWITCHES, DATA_TVH, SIGNAL_UPDATE_TVH)
+    CONF_SWITCHES, DATA_TVH, SIGNAL_UPDATE_TVH_STREAM)
 
 from homeassistant.core import callback
 from homeassistant.helpers.dispatcher import (
@@ -27,6 +27,14 @@ async def async_setup_platform(hass, config, async_add_entities,
         sname = '{}_{}'.format(name, index)
         all_switches.append(TVHSwitch(sname, tvh.stream_list[index]))
 
+    @callback
+    def async_add_slot(index):
+        """Add a switch for a slot added on overflow."""
+        sname = '{}_{}'.format(name, index)
+        async_add_entities([TVHSwitch(sname, tvh.stream_list[index])], True)
+
+    tvh.add_slot_callback(async_add_slot)
+
     async_add_entities(all_switches, True)
 
 
@@ -37,6 +45,7 @@ class TVHSwitch(SwitchDevice):
         """Initialize of KNX switch."""
         self._stream = stream
         self._name = name
+        self._index = self._name.split('_')[1]
 
         _LOGGER.debug('Setup new stream switch: {}'.format(name))
 
@@ -48,7 +57,8 @@ class TVHSwitch(SwitchDevice):
             self.async_schedule_update_ha_state(True)
 
         async_dispatcher_connect(
-            self.hass, SIGNAL_UPDATE_TVH, async_tvh_update)
+            self.hass, SIGNAL_UPDATE_TVH_STREAM.format(self._index),
+            async_tvh_update)
 
     @property
     def name(self):
@@ -69,7 +79,7 @@ class TVHSwitch(SwitchDevice):
     @property
     def available(self):
         """Return True if entity is available."""
-        return self._stream.is_active
+        return self._stream.server.ready and self._stream.is_active
 
     async def async_turn_on(self, **kwargs):
         """Turn the entity on."""
@@ -0,0 +1,68 @@
+"""
+pytvheadend.breaker
+~~~~~~~~~~~~~~~~~~~~
+Circuit breaker guarding requests to an overloaded TVHeadend
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import logging
+import time
+
+from pytvheadend.constants import BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """Reject requests after repeated failures, probe after a pause"""
+    def __init__(self, threshold=BREAKER_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        """Initialize circuit breaker."""
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened = None
+
+    @property
+    def is_open(self):
+        """Return True while requests are being rejected"""
+        return self._opened is not None
+
+    @property
+    def failures(self):
+        """Return number of consecutive failures"""
+        return self._failures
+
+    def allow(self):
+        """Return True if a request may be made now."""
+        if self._opened is None:
+            return True
+        now = self._clock()
+        if now - self._opened < self._reset_timeout:
+            return False
+        # Let one probe through, everything else waits another pause
+        self._opened = now
+        return True
+
+    def success(self):
+        """Record a request the server answered."""
+        if self._opened is not None:
+            _LOGGER.info('Server answering again, closing circuit.')
+        self._failures = 0
+        self._opened = None
+
+    def failure(self):
+        """Record a failed request, return True if the circuit opened."""
+        self._failures += 1
+        if self._opened is not None:
+            # Probe failed, wait another pause
+            self._opened = self._clock()
+            return False
+        if self._failures < self._threshold:
+            return False
+        _LOGGER.warning('%s requests failed in a row, pausing requests '
+                        'for %ss.', self._failures, self._reset_timeout)
+        self._opened = self._clock()
+        return True
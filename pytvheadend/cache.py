@@ -0,0 +1,89 @@
+"""
+pytvheadend.cache
+~~~~~~~~~~~~~~~~~~~~
+Persistent on-disk cache of TVHeadend grids
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import json
+import logging
+import sqlite3
+import time
+import zlib
+
+from pytvheadend.grid import plain_entries
+
+_LOGGER = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS grids (
+    host TEXT NOT NULL,
+    grid TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    updated REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (host, grid)
+)
+"""
+
+
+class GridCache(object):
+    """Store grid entries in a sqlite table keyed by host and grid"""
+    def __init__(self, path, loads=json.loads):
+        """Initialize grid cache."""
+        self.path = path
+        self._loads = loads
+
+    def _connect(self):
+        """Open database, creating the table if needed."""
+        conn = sqlite3.connect(self.path)
+        conn.execute(_SCHEMA)
+        return conn
+
+    def load(self, host, grid, factory=None):
+        """Return (entries, digest) for a grid, None if not cached."""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    'SELECT digest, data FROM grids WHERE host=? AND grid=?',
+                    (host, grid)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            entries = self._loads(zlib.decompress(row[1]))
+            if factory is not None:
+                entries = [factory(entry) for entry in entries]
+        except (sqlite3.Error, zlib.error, ValueError, KeyError,
+                AttributeError) as err:
+            _LOGGER.error('Unable to load cached %s grid. %s', grid, err)
+            return None
+
+        _LOGGER.debug('Loaded %s cached %s entries for %s',
+                      len(entries), grid, host)
+        return entries, row[0]
+
+    def save(self, host, grid, entries, digest):
+        """Store entries for a grid."""
+        data = json.dumps(plain_entries(entries), separators=(',', ':'))
+        data = zlib.compress(data.encode('utf-8'))
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO grids '
+                        '(host, grid, digest, updated, data) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (host, grid, digest, time.time(), data))
+            finally:
+                conn.close()
+        except sqlite3.Error as err:
+            _LOGGER.error('Unable to cache %s grid. %s', grid, err)
+            return False
+
+        _LOGGER.debug('Cached %s %s entries for %s (%s bytes)',
+                      len(entries), grid, host, len(data))
+        return True
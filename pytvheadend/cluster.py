@@ -0,0 +1,198 @@
+"""
+pytvheadend.cluster
+~~~~~~~~~~~~~~~~~~~~
+Drive several TVHeadend servers from one event loop
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import asyncio
+import logging
+import random
+from functools import partial
+
+import aiohttp
+
+from pytvheadend.tvheadend import TVHeadend
+from pytvheadend.constants import (
+    DEFAULT_PORT, DEFAULT_HEADERS, DEFAULT_POOL_SIZE, DEFAULT_POOL_PER_HOST,
+    DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_DNS_TTL, DEFAULT_POLL_INTERVAL,
+    POLL_JITTER)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TVHeadendCluster(object):
+    """Manage many TVHeadend servers sharing one pooled session."""
+    def __init__(self, servers=None, maxconn=None, loop=None,
+                 poll_interval=DEFAULT_POLL_INTERVAL,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 pool_per_host=DEFAULT_POOL_PER_HOST,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 dns_ttl=DEFAULT_DNS_TTL):
+        """Initialize cluster.
+
+        servers is a list of dicts of TVHeadend keyword arguments, each
+        with a 'host' and optionally a 'name'.  Servers without their own
+        'maxconn' share the cluster maxconn slots evenly.  Each server gets
+        at least one slot, so a maxconn below the number of such servers
+        is exceeded.
+        """
+        if loop is None:
+            _LOGGER.info("Must supply asyncio loop.  Quitting")
+            return
+
+        self._event_loop = loop
+        self._poll_interval = poll_interval
+
+        connector = aiohttp.TCPConnector(
+            limit=pool_size, limit_per_host=pool_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_ttl, loop=self._event_loop)
+        self._api_session = aiohttp.ClientSession(
+            connector=connector, headers=DEFAULT_HEADERS,
+            loop=self._event_loop)
+
+        self._servers = {}
+        self._poll_tasks = {}
+
+        # Merged view of active streams across servers
+        self._active = {}
+        self._channels = {}
+
+        self._update_callbacks = []
+
+        servers = servers or []
+        shared = [conf for conf in servers if 'maxconn' not in conf]
+        if shared and maxconn:
+            if int(maxconn) < len(shared):
+                _LOGGER.warning('maxconn %s is below the %s servers sharing '
+                                'it, giving each one slot.',
+                                maxconn, len(shared))
+            per_server, extra = divmod(int(maxconn), len(shared))
+        else:
+            per_server, extra = 1, 0
+        for conf in servers:
+            conf = dict(conf)
+            if 'maxconn' not in conf:
+                conf['maxconn'] = max(1, per_server + (1 if extra else 0))
+                extra = max(0, extra - 1)
+            self.add_server(**conf)
+
+    @property
+    def servers(self):
+        """Return dictionary of servers by name"""
+        return self._servers
+
+    @property
+    def active_streams(self):
+        """Return dictionary of active streams by (server, index)"""
+        return self._active
+
+    @property
+    def stream_list(self):
+        """Return list of (server name, stream) for every slot"""
+        slots = []
+        for name, server in self._servers.items():
+            for strm in server.stream_list:
+                slots.append((name, strm))
+        return slots
+
+    def add_server(self, host, port=DEFAULT_PORT, name=None, maxconn=1,
+                   **kwargs):
+        """Add a server to the cluster, return it."""
+        name = name or '{}:{}'.format(host, port)
+        if name in self._servers:
+            _LOGGER.error('Server %s already in cluster.', name)
+            return self._servers[name]
+
+        server = TVHeadend(host, port, maxconn=maxconn,
+                           loop=self._event_loop,
+                           session=self._api_session, **kwargs)
+        server.add_update_callback(partial(self._stream_updated, name))
+        self._servers[name] = server
+        _LOGGER.debug('Added server %s with %s slots.', name, maxconn)
+        return server
+
+    def get_stream(self, name, index):
+        """Return stream slot of a server"""
+        return self._servers[name].stream_list[index]
+
+    def find_channel(self, channel_name):
+        """Return list of (server name, stream) showing a channel"""
+        if not channel_name:
+            return []
+        return [(name, self._servers[name].stream_list[index])
+                for name, index in
+                self._channels.get(channel_name.upper(), ())]
+
+    def add_update_callback(self, callback):
+        """Register callback for when a stream on any server changes."""
+        self._update_callbacks.append(callback)
+
+    def remove_update_callback(self, callback):
+        """Remove a registered update callback."""
+        if callback in self._update_callbacks:
+            self._update_callbacks.remove(callback)
+
+    def _stream_updated(self, name, index):
+        """Keep merged view current and pass update on."""
+        key = (name, index)
+        strm = self._servers[name].stream_list[index]
+
+        old = self._active.pop(key, None)
+        if old is not None:
+            slots = self._channels.get(old)
+            if slots is not None:
+                slots.discard(key)
+                if not slots:
+                    del self._channels[old]
+
+        if strm.is_active:
+            self._active[key] = strm.channel_name
+            self._channels.setdefault(strm.channel_name, set()).add(key)
+
+        for callback in self._update_callbacks:
+            callback(name, index)
+
+    async def start(self):
+        """Start all servers and their polling."""
+        results = await asyncio.gather(
+            *[server.start() for server in self._servers.values()])
+        self.start_polling()
+        return all(results)
+
+    def start_polling(self):
+        """Schedule subscription polling for every server."""
+        for name, server in self._servers.items():
+            task = self._poll_tasks.get(name)
+            if task is None or task.done():
+                self._poll_tasks[name] = self._event_loop.create_task(
+                    self._poll(server))
+
+    async def _poll(self, server):
+        """Poll one server with a jittered interval."""
+        # Spread first polls so servers do not all fire together
+        await asyncio.sleep(random.uniform(0, self._poll_interval))
+        while True:
+            if not server.push_active:
+                await server.fetch_subscription_list()
+            await asyncio.sleep(self._poll_interval * random.uniform(
+                1 - POLL_JITTER, 1 + POLL_JITTER))
+
+    async def stop(self):
+        """Stop polling, servers and the shared session."""
+        tasks = list(self._poll_tasks.values())
+        self._poll_tasks = {}
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        await asyncio.gather(
+            *[server.stop() for server in self._servers.values()])
+        _LOGGER.debug('Closing cluster session.')
+        await self._api_session.close()
@@ -15,14 +15,143 @@ __version__ = '{}.{}.{}'.format(
 # API_URL = 'https://app-api.8slp.net/v1'
 
 SUBSCRIPTIONS_URL = '/api/status/subscriptions'
-CHANNELS_URL = '/api/channel/grid?start=0&limit=999999999'
-SERVICES_URL = '/api/mpegts/service/grid?start=0&limit=999999999'
-MUXES_URL = '/api/mpegts/mux/grid?start=0&limit=999999999'
+INPUTS_URL = '/api/status/inputs'
+CHANNELS_URL = '/api/channel/grid'
+SERVICES_URL = '/api/mpegts/service/grid'
+MUXES_URL = '/api/mpegts/mux/grid'
+IDNODE_SAVE_URL = '/api/idnode/save'
+IDNODE_LOAD_URL = '/api/idnode/load'
+EPG_URL = '/api/epg/events/grid'
+
+COMET_POLL_URL = '/comet/poll'
+COMET_WS_URL = '/comet/ws'
+
+# Notification classes handled in push mode
+COMET_SUBSCRIPTIONS = 'subscriptions'
+COMET_CHANNEL = 'channel'
+COMET_SERVICE = 'service'
+COMET_MUX = 'mpegts_mux'
+COMET_INPUTS = 'input_status'
+COMET_EPG = 'epg'
+
+# Server holds a long-poll open for up to 10s
+COMET_POLL_TIMEOUT = 30
+COMET_RETRY_INTERVAL = 30
+COMET_HEARTBEAT = 30
+
+# Changed idnodes are collected for this many seconds before loading
+IDNODE_DEBOUNCE = 0.5
+
+# Input status notifications refetch inputs at most this often
+INPUT_REFRESH_INTERVAL = 5
+
+# Channels remembered for returning a stream to its last slot
+SLOT_MEMORY = 256
+
+# Subscription counters kept per stream, samples in each window and
+# seconds between samples
+SERIES_FIELDS = ('bytes_in', 'bytes_out', 'errors')
+SERIES_WINDOW = 120
+SERIES_INTERVAL = 10
+
+# Grid fields used by the library, everything else is dropped on load
+CHANNEL_FIELDS = ('uuid', 'name', 'services')
+SERVICE_FIELDS = ('uuid', 'network', 'multiplex_uuid')
+MUX_FIELDS = ('uuid', 'name', 'network')
+EPG_FIELDS = ('eventId', 'channelUuid', 'start', 'stop', 'title',
+              'subtitle')
+
+# Channel schedules are reloaded after this many seconds, or after
+# EPG_NOTIFY_INTERVAL when the server reports guide changes
+EPG_MAX_AGE = 3600
+EPG_NOTIFY_INTERVAL = 60
+
+GRID_CHUNK_SIZE = 65536
+
+# Grid names, used as cache keys
+GRID_CHANNELS = 'channels'
+GRID_SERVICES = 'services'
+GRID_MUXES = 'muxes'
+
+# Patched grids are written to the cache this many seconds after the
+# last patch
+CACHE_SAVE_DELAY = 10
+
+# Grids that fail to load on a lazy start are retried this often
+START_RETRY_INTERVAL = 30
+
+# Refresh of cached grids is spread over this many seconds after start
+CACHE_REFRESH_JITTER = 30
+
+# Grids are fetched in windows of this many entries, None for one request
+DEFAULT_PAGE_SIZE = 2000
+DEFAULT_PAGE_CONCURRENCY = 4
+
+# Waiting for a stream to move off disabled services
+DEFAULT_SETTLE_TIMEOUT = 15
+SETTLE_MIN_DELAY = 0.25
+SETTLE_MAX_DELAY = 2
+# First poll comes after this fraction of the fastest known switch
+SETTLE_FIRST_FRACTION = 0.5
+# Weight of the newest observation in the per-network latency average
+SETTLE_SMOOTHING = 0.3
+
+# Failover scheduling, a failed hop costs as much as a settle timeout
+SCHEDULER_SMOOTHING = 0.3
+# Success rate assumed for a service never switched to
+SCHEDULER_PRIOR = 0.5
+# Seconds of cost added per error per second seen on a service
+SCHEDULER_ERROR_COST = 10
+# Seconds saved by a service on a mux that is already tuned
+SCHEDULER_RETUNE_COST = 2
+# Services remembered as tried per channel, and channels remembered
+SCHEDULER_HISTORY = 8
+SCHEDULER_CHANNELS = 256
+
+# Connection pool of the api session
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_PER_HOST = 0
+DEFAULT_KEEPALIVE_TIMEOUT = 30
+DEFAULT_DNS_TTL = 300
+
+# Cluster subscription polling, interval varies by +/- POLL_JITTER
+DEFAULT_POLL_INTERVAL = 30
+POLL_JITTER = 0.1
+
+AUTH_BASIC = 'basic'
+AUTH_DIGEST = 'digest'
+
+# JSON backends, the fastest installed is used unless one is chosen
+JSON_ORJSON = 'orjson'
+JSON_UJSON = 'ujson'
+JSON_STDLIB = 'json'
+# Payloads of this many bytes or more are decoded off the event loop
+DECODE_OFFLOAD_SIZE = 262144
+
+# Upper bounds in seconds of the metrics latency histogram buckets
+METRIC_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
 
 DEFAULT_PORT = 9981
 
 DEFAULT_TIMEOUT = 60
 
+# Request timeouts in seconds by api path, DEFAULT_TIMEOUT otherwise
+REQUEST_TIMEOUTS = {
+    SUBSCRIPTIONS_URL: 10,
+    IDNODE_SAVE_URL: 15,
+    IDNODE_LOAD_URL: 15,
+    }
+
+# Idempotent requests are retried with jittered exponential backoff
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Consecutive failures that stop requests, and seconds until a probe
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
 DEFAULT_HEADERS = {
     # 'content-type': "application/x-www-form-urlencoded",
     # 'connection': "keep-alive",
@@ -0,0 +1,74 @@
+"""
+pytvheadend.decoder
+~~~~~~~~~~~~~~~~~~~~
+JSON decoding with the fastest available backend
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import json
+import logging
+
+from pytvheadend.constants import (
+    JSON_ORJSON, JSON_UJSON, JSON_STDLIB, DECODE_OFFLOAD_SIZE)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _load_backend(name):
+    """Return loads function of a backend, None if not installed."""
+    try:
+        if name == JSON_ORJSON:
+            import orjson
+            return orjson.loads
+        if name == JSON_UJSON:
+            import ujson
+            return ujson.loads
+    except ImportError:
+        return None
+    if name == JSON_STDLIB:
+        return json.loads
+    return None
+
+
+class JSONDecoder(object):
+    """Decode JSON with orjson or ujson if installed, stdlib otherwise"""
+    def __init__(self, backend=None, offload_size=DECODE_OFFLOAD_SIZE,
+                 loop=None):
+        """Initialize decoder.
+
+        Payloads of at least offload_size bytes are decoded in the
+        loop's executor by decode_async, None decodes everything inline.
+        """
+        self._loop = loop
+        self._offload_size = offload_size
+
+        loads = _load_backend(backend) if backend else None
+        if backend and loads is None:
+            _LOGGER.error('JSON backend %s not available.', backend)
+        if loads is None:
+            for backend in (JSON_ORJSON, JSON_UJSON, JSON_STDLIB):
+                loads = _load_backend(backend)
+                if loads is not None:
+                    break
+        self.backend = backend
+        self._loads = loads
+        _LOGGER.debug('Decoding JSON with %s.', backend)
+
+    @property
+    def streaming(self):
+        """Return True if grids are best parsed as they stream in"""
+        # The stdlib decoder can decode one record at a time, the fast
+        # backends only whole documents
+        return self.backend == JSON_STDLIB
+
+    def decode(self, data):
+        """Decode a JSON document from bytes or text."""
+        return self._loads(data)
+
+    async def decode_async(self, data):
+        """Decode a JSON document, off the event loop if it is large."""
+        if self._loop is None or self._offload_size is None or \
+                len(data) < self._offload_size:
+            return self._loads(data)
+        return await self._loop.run_in_executor(None, self._loads, data)
@@ -0,0 +1,136 @@
+"""
+pytvheadend.epg
+~~~~~~~~~~~~~~~~~~~~
+Time indexed programme guide per channel
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import logging
+import time
+from array import array
+from bisect import bisect_right
+from operator import attrgetter
+
+from pytvheadend.constants import EPG_MAX_AGE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Schedule(object):
+    """Programmes of one channel in start order"""
+    __slots__ = ('starts', 'stops', 'events', 'loaded')
+
+    def __init__(self, events, loaded):
+        """Initialize schedule, dropping overlapping events."""
+        self.starts = array('q')
+        self.stops = array('q')
+        self.events = []
+        self.loaded = loaded
+
+        # Overlaps come from windows shifting between pages, keeping
+        # stops ordered lets expired events be found by bisection
+        for event in sorted(events, key=attrgetter('start')):
+            if self.stops and event.start < self.stops[-1]:
+                continue
+            self.starts.append(event.start)
+            self.stops.append(event.stop)
+            self.events.append(event)
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def horizon(self):
+        """Return stop time of the last programme, None if empty"""
+        return self.stops[-1] if self.stops else None
+
+    def trim(self, now):
+        """Drop programmes that ended by now, return number dropped."""
+        count = bisect_right(self.stops, now)
+        if count:
+            del self.starts[:count]
+            del self.stops[:count]
+            del self.events[:count]
+        return count
+
+    def now_next(self, now):
+        """Return programme on at now and the one after it."""
+        index = bisect_right(self.starts, now) - 1
+        current = None
+        if index >= 0 and self.stops[index] > now:
+            current = self.events[index]
+        following = self.events[index + 1] \
+            if index + 1 < len(self.events) else None
+        return current, following
+
+
+class EPG(object):
+    """Programme schedules by channel uuid"""
+    def __init__(self, clock=time.time):
+        """Initialize programme guide."""
+        self._clock = clock
+        self._schedules = {}
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def __contains__(self, channel_uuid):
+        return channel_uuid in self._schedules
+
+    @property
+    def event_count(self):
+        """Return number of programmes held"""
+        return sum(len(sched) for sched in self._schedules.values())
+
+    def schedule(self, channel_uuid):
+        """Return schedule of a channel, None if not loaded."""
+        return self._schedules.get(channel_uuid)
+
+    def load(self, events, channel_uuids=()):
+        """Replace schedules of channels with loaded events.
+
+        Channels in channel_uuids without events get an empty schedule
+        so they are not reloaded before they go stale.
+        """
+        now = self._clock()
+        grouped = {uuid: [] for uuid in channel_uuids}
+        for event in events:
+            grouped.setdefault(event.channel_uuid, []).append(event)
+        for uuid, channel_events in grouped.items():
+            sched = self._schedules[uuid] = Schedule(channel_events, now)
+            sched.trim(now)
+        _LOGGER.debug('Loaded programmes of %s channels.', len(grouped))
+
+    def discard(self, channel_uuid):
+        """Drop the schedule of a channel."""
+        self._schedules.pop(channel_uuid, None)
+
+    def stale(self, channel_uuid, max_age=EPG_MAX_AGE):
+        """Return True if a channel's schedule needs loading."""
+        sched = self._schedules.get(channel_uuid)
+        return sched is None or self._clock() - sched.loaded >= max_age
+
+    def now_next(self, channel_uuid, now=None):
+        """Return current and next programme of a channel.
+
+        Programmes that ended are evicted from the channel on lookup.
+        """
+        sched = self._schedules.get(channel_uuid)
+        if sched is None:
+            return None, None
+        if now is None:
+            now = self._clock()
+        sched.trim(now)
+        return sched.now_next(now)
+
+    def evict(self, now=None):
+        """Drop ended programmes of every channel, return number dropped."""
+        if now is None:
+            now = self._clock()
+        count = 0
+        for sched in self._schedules.values():
+            count += sched.trim(now)
+        if count:
+            _LOGGER.debug('Evicted %s ended programmes.', count)
+        return count
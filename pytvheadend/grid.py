@@ -0,0 +1,160 @@
+"""
+pytvheadend.grid
+~~~~~~~~~~~~~~~~~~~~
+Incremental reader for TVHeadend grid responses
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import codecs
+import hashlib
+import json
+import logging
+import re
+
+from pytvheadend.constants import GRID_CHUNK_SIZE
+from pytvheadend.records import Record
+
+_LOGGER = logging.getLogger(__name__)
+
+_ENTRIES_RE = re.compile(r'"entries"\s*:\s*\[')
+# Most grids send total, the EPG grid totalCount
+_TOTAL_RE = re.compile(r'"total(?:Count)?"\s*:\s*(\d+)')
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+_TOTAL_BYTES_RE = re.compile(br'"total(?:Count)?"\s*:\s*(\d+)')
+
+_STATE_HEAD = 0
+_STATE_ITEMS = 1
+_STATE_TAIL = 2
+
+
+def grid_total(data):
+    """Return total of a raw grid response without parsing entries."""
+    # The server writes total after the entries array
+    match = _TOTAL_BYTES_RE.search(data, max(0, len(data) - 64)) or \
+        _TOTAL_BYTES_RE.search(data)
+    return int(match.group(1)) if match else None
+
+
+def plain_entries(entries):
+    """Return entries with records converted to dictionaries."""
+    return [entry.as_dict() if isinstance(entry, Record) else entry
+            for entry in entries]
+
+
+def grid_digest(entries):
+    """Return content hash of a list of grid entries."""
+    data = json.dumps(plain_entries(entries), sort_keys=True,
+                      separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class GridReader(object):
+    """Parse the entries array of a grid response one record at a time"""
+    def __init__(self, fields=None, factory=None):
+        """Initialize grid reader.
+
+        factory is called with each trimmed record and its result is
+        kept in place of the record, or dropped if None.
+        """
+        self._fields = fields
+        self._factory = factory
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+
+        self._state = _STATE_HEAD
+        self._buf = ''
+        self._head = ''
+
+        self.entries = []
+        self.total = None
+        # Records parsed, including those the factory dropped
+        self.count = 0
+
+    def feed(self, data):
+        """Feed a chunk of response data to the reader."""
+        if isinstance(data, bytes):
+            data = self._text.decode(data)
+        self._buf += data
+
+        if self._state == _STATE_HEAD:
+            match = _ENTRIES_RE.search(self._buf)
+            if not match:
+                return
+            self._head = self._buf[:match.start()]
+            self._buf = self._buf[match.end():]
+            self._state = _STATE_ITEMS
+
+        if self._state == _STATE_ITEMS:
+            self._parse_items()
+
+    def _parse_items(self):
+        """Decode every complete record currently buffered."""
+        buf = self._buf
+        pos = 0
+        while True:
+            pos = _SEPARATOR_RE.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                self._state = _STATE_TAIL
+                pos += 1
+                break
+            try:
+                entry, pos = self._decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Record is split across chunks, wait for more data
+                break
+            self._add_entry(entry)
+        self._buf = buf[pos:]
+
+    def _add_entry(self, entry):
+        """Trim record to the wanted fields and hand it off."""
+        self.count += 1
+        if self._fields is not None:
+            entry = {key: entry[key] for key in self._fields if key in entry}
+        if self._factory is not None:
+            entry = self._factory(entry)
+            if entry is None:
+                return
+        self.entries.append(entry)
+
+    def close(self):
+        """Finish parsing, return list of entries."""
+        self._buf += self._text.decode(b'', final=True)
+
+        if self._state == _STATE_HEAD:
+            # No entries array, fall back to decoding the whole body
+            result = json.loads(self._buf)
+            self._head = ''
+            self._buf = ''
+            self.load(result)
+        elif self._state == _STATE_ITEMS:
+            raise ValueError('Grid response ended inside entries array.')
+
+        if self.total is None:
+            match = _TOTAL_RE.search(self._head + self._buf)
+            if match:
+                self.total = int(match.group(1))
+        self._head = ''
+        self._buf = ''
+
+        _LOGGER.debug('Grid read complete: %s entries, total %s',
+                      len(self.entries), self.total)
+        return self.entries
+
+    def load(self, result):
+        """Take entries from an already decoded grid response."""
+        if isinstance(result, dict):
+            for key in ('total', 'totalCount'):
+                if result.get(key) is not None:
+                    self.total = result[key]
+            for entry in result.get('entries', []):
+                self._add_entry(entry)
+        return self.entries
+
+    async def read(self, content, chunk_size=GRID_CHUNK_SIZE):
+        """Read an aiohttp response stream to completion."""
+        async for chunk in content.iter_chunked(chunk_size):
+            self.feed(chunk)
+        return self.close()
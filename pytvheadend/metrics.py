@@ -0,0 +1,119 @@
+"""
+pytvheadend.metrics
+~~~~~~~~~~~~~~~~~~~~
+Lightweight request and timing metrics for TVHeadend
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+from bisect import bisect_left
+
+from pytvheadend.constants import METRIC_BUCKETS
+
+
+class Histogram(object):
+    """Fixed bucket histogram of durations in seconds"""
+    __slots__ = ('count', 'total', 'maximum', '_counts')
+
+    def __init__(self):
+        """Initialize histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        # Last bucket collects everything above the largest bound
+        self._counts = [0] * (len(METRIC_BUCKETS) + 1)
+
+    def observe(self, value):
+        """Add an observation."""
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+        self._counts[bisect_left(METRIC_BUCKETS, value)] += 1
+
+    def snapshot(self):
+        """Return histogram as a dictionary."""
+        buckets = {}
+        running = 0
+        for bound, count in zip(METRIC_BUCKETS + ('+Inf',), self._counts):
+            running += count
+            buckets[str(bound)] = running
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.maximum,
+            'buckets': buckets,
+            }
+
+
+class RequestStats(object):
+    """Counters for a single api endpoint"""
+    __slots__ = ('latency', 'bytes', 'errors', 'timeouts')
+
+    def __init__(self):
+        """Initialize endpoint counters."""
+        self.latency = Histogram()
+        self.bytes = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def snapshot(self):
+        """Return endpoint counters as a dictionary."""
+        return {
+            'latency': self.latency.snapshot(),
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            }
+
+
+class Metrics(object):
+    """Per-endpoint request stats, timings and event counters"""
+    def __init__(self):
+        """Initialize metrics."""
+        self._requests = {}
+        self._timings = {}
+        self._counters = {}
+
+    def _endpoint(self, endpoint):
+        """Return stats of an endpoint, creating them if needed."""
+        stats = self._requests.get(endpoint)
+        if stats is None:
+            stats = self._requests[endpoint] = RequestStats()
+        return stats
+
+    def observe_request(self, endpoint, seconds, nbytes=0):
+        """Record a completed request."""
+        stats = self._endpoint(endpoint)
+        stats.latency.observe(seconds)
+        stats.bytes += nbytes
+
+    def request_error(self, endpoint, timeout=False):
+        """Record a failed request."""
+        stats = self._endpoint(endpoint)
+        if timeout:
+            stats.timeouts += 1
+        else:
+            stats.errors += 1
+
+    def observe(self, name, seconds):
+        """Record duration of a named operation."""
+        hist = self._timings.get(name)
+        if hist is None:
+            hist = self._timings[name] = Histogram()
+        hist.observe(seconds)
+
+    def count(self, name, amount=1):
+        """Increment a named counter."""
+        self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Return all metrics as a dictionary."""
+        return {
+            'requests': {endpoint: stats.snapshot() for endpoint, stats
+                         in self._requests.items()},
+            'timings': {name: hist.snapshot() for name, hist
+                        in self._timings.items()},
+            'counters': dict(self._counters),
+            }
@@ -0,0 +1,179 @@
+"""
+pytvheadend.records
+~~~~~~~~~~~~~~~~~~~~
+Compact record types for grid and subscription data
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+from sys import intern
+
+
+class Record(object):
+    """Base for slotted records holding only the fields we use"""
+    __slots__ = ()
+
+    def values(self):
+        """Return tuple of field values."""
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def as_dict(self):
+        """Return record as a dictionary."""
+        return dict(zip(self.__slots__, self.values()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(field, value) for field, value
+            in zip(self.__slots__, self.values())))
+
+
+class Channel(Record):
+    """Channel grid entry"""
+    __slots__ = ('uuid', 'name', 'services')
+
+    def __init__(self, uuid, name, services=()):
+        """Initialize channel record."""
+        self.uuid = intern(uuid)
+        self.name = intern(name)
+        self.services = tuple(intern(serv) for serv in services)
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Return channel from a grid entry."""
+        return cls(entry['uuid'], entry['name'], entry.get('services', ()))
+
+
+class Service(Record):
+    """Service grid entry, network is upper case"""
+    __slots__ = ('uuid', 'network', 'mux_uuid')
+
+    def __init__(self, uuid, network, mux_uuid):
+        """Initialize service record."""
+        self.uuid = intern(uuid)
+        self.network = intern(network.upper())
+        self.mux_uuid = intern(mux_uuid)
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Return service from a grid entry."""
+        return cls(entry['uuid'], entry['network'],
+                   entry.get('multiplex_uuid', entry.get('mux_uuid')))
+
+
+class Mux(Record):
+    """Mux grid entry"""
+    __slots__ = ('uuid', 'name', 'network')
+
+    def __init__(self, uuid, name=None, network=None):
+        """Initialize mux record."""
+        self.uuid = intern(uuid)
+        self.name = name
+        self.network = intern(network) if network else network
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Return mux from a grid entry."""
+        return cls(entry['uuid'], entry.get('name'), entry.get('network'))
+
+
+class Subscription(Record):
+    """Active subscription, name and network are upper case"""
+    __slots__ = ('id', 'name', 'network', 'errors', 'bytes_in', 'bytes_out')
+
+    def __init__(self, id, name, network, errors=None, bytes_in=None,
+                 bytes_out=None):
+        """Initialize subscription record."""
+        # pylint: disable=redefined-builtin
+        self.id = id
+        self.name = intern(name.upper())
+        self.network = intern(network.upper())
+        self.errors = errors
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Return subscription from a status entry."""
+        return cls(entry['id'], entry['channel'],
+                   entry['service'].split("/")[1], entry.get('errors'),
+                   entry.get('total_in'), entry.get('total_out'))
+
+    @property
+    def stream_name(self):
+        """Return key identifying the stream."""
+        return '{}.{}'.format(self.id, self.name)
+
+
+class Input(Record):
+    """Tuner input streaming a mux"""
+    __slots__ = ('uuid', 'name', 'stream', 'mux_uuid', 'subs', 'weight',
+                 'signal', 'snr', 'cc', 'te')
+
+    def __init__(self, uuid, name, stream, mux_uuid=None, subs=0, weight=0,
+                 signal=None, snr=None, cc=0, te=0):
+        """Initialize input record."""
+        self.uuid = intern(uuid)
+        self.name = intern(name)
+        self.stream = stream
+        self.mux_uuid = mux_uuid
+        self.subs = subs
+        self.weight = weight
+        self.signal = signal
+        self.snr = snr
+        self.cc = cc
+        self.te = te
+
+    @classmethod
+    def from_entry(cls, entry, mux_uuid=None):
+        """Return input from a status entry."""
+        return cls(entry['uuid'], entry['input'], entry.get('stream'),
+                   mux_uuid, entry.get('subs', 0), entry.get('weight', 0),
+                   entry.get('signal'), entry.get('snr'),
+                   entry.get('cc', 0), entry.get('te', 0))
+
+    @property
+    def errors(self):
+        """Return continuity plus transport error count."""
+        return (self.cc or 0) + (self.te or 0)
+
+
+class Event(Record):
+    """EPG event, start and stop are epoch seconds"""
+    __slots__ = ('id', 'channel_uuid', 'start', 'stop', 'title', 'subtitle')
+
+    def __init__(self, id, channel_uuid, start, stop, title=None,
+                 subtitle=None):
+        """Initialize event record."""
+        # pylint: disable=redefined-builtin
+        self.id = id
+        self.channel_uuid = intern(channel_uuid)
+        self.start = int(start)
+        self.stop = int(stop)
+        self.title = title
+        self.subtitle = subtitle
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Return event from an EPG grid entry."""
+        return cls(entry['eventId'], entry['channelUuid'], entry['start'],
+                   entry['stop'], entry.get('title'), entry.get('subtitle'))
+
+
+class ServiceOption(Record):
+    """Service a stream can switch to"""
+    __slots__ = ('name', 'service_uuid', 'mux_uuid', 'active')
+
+    def __init__(self, name, service_uuid, mux_uuid, active=False):
+        """Initialize service option record."""
+        self.name = name
+        self.service_uuid = service_uuid
+        self.mux_uuid = mux_uuid
+        self.active = active
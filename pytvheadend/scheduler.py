@@ -0,0 +1,188 @@
+"""
+pytvheadend.scheduler
+~~~~~~~~~~~~~~~~~~~~
+Picks the service a stream fails over to from observed quality
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import logging
+import time
+from collections import OrderedDict, deque
+
+from pytvheadend.constants import (
+    SCHEDULER_SMOOTHING, SCHEDULER_PRIOR, SCHEDULER_ERROR_COST,
+    SCHEDULER_RETUNE_COST,
+    SCHEDULER_HISTORY, SCHEDULER_CHANNELS, DEFAULT_SETTLE_TIMEOUT,
+    SETTLE_MAX_DELAY)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _smooth(average, value):
+    """Return exponentially weighted average including value."""
+    if average is None:
+        return value
+    return average + SCHEDULER_SMOOTHING * (value - average)
+
+
+class ServiceStats(object):
+    """Observed outcomes of a single service"""
+    __slots__ = ('quality', 'lock_time', 'error_rate', 'switches',
+                 'failures', 'counters')
+
+    def __init__(self):
+        """Initialize service stats."""
+        self.quality = SCHEDULER_PRIOR
+        self.lock_time = None
+        self.error_rate = None
+        self.switches = 0
+        self.failures = 0
+        # Last (count, time) of each error counter source
+        self.counters = {}
+
+    def cost(self):
+        """Return expected seconds lost failing over to this service."""
+        lock_time = SETTLE_MAX_DELAY if self.lock_time is None \
+            else self.lock_time
+        cost = (1 - self.quality) * DEFAULT_SETTLE_TIMEOUT + lock_time
+        if self.error_rate:
+            cost += self.error_rate * SCHEDULER_ERROR_COST
+        return cost
+
+    def as_dict(self):
+        """Return stats as a dictionary."""
+        return {
+            'quality': self.quality,
+            'lock_time': self.lock_time,
+            'error_rate': self.error_rate,
+            'switches': self.switches,
+            'failures': self.failures,
+            'cost': self.cost(),
+            }
+
+
+class ServiceScheduler(object):
+    """Rank services by observed lock time, failures and error rate"""
+    def __init__(self, clock=time.monotonic):
+        """Initialize scheduler."""
+        self._clock = clock
+        self._stats = {}
+        # Networks recently tried per channel, least used channel first
+        self._history = OrderedDict()
+
+    def stats(self, service_uuid):
+        """Return stats of a service, None if never observed."""
+        return self._stats.get(service_uuid)
+
+    def _service(self, service_uuid):
+        """Return stats of a service, creating them if needed."""
+        stats = self._stats.get(service_uuid)
+        if stats is None:
+            stats = self._stats[service_uuid] = ServiceStats()
+        return stats
+
+    def record_lock(self, service_uuid, seconds):
+        """Record a switch that settled on a service."""
+        stats = self._service(service_uuid)
+        stats.switches += 1
+        stats.quality = _smooth(stats.quality, 1.0)
+        stats.lock_time = _smooth(stats.lock_time, seconds)
+
+    def record_failure(self, service_uuid):
+        """Record a service that did not deliver."""
+        stats = self._service(service_uuid)
+        stats.failures += 1
+        stats.quality = _smooth(stats.quality, 0.0)
+
+    def record_errors(self, service_uuid, errors, source='subscription'):
+        """Record a running error counter of a service.
+
+        Each source, e.g. the subscription or the tuner input, keeps
+        its own baseline.
+        """
+        if errors is None:
+            return
+        stats = self._service(service_uuid)
+        now = self._clock()
+        last = stats.counters.get(source)
+        if last is not None and errors >= last[0] and now > last[1]:
+            stats.error_rate = _smooth(
+                stats.error_rate, (errors - last[0]) / (now - last[1]))
+        # A lower count means a new subscription, start a new baseline
+        stats.counters[source] = (errors, now)
+
+    def cost(self, service_uuid):
+        """Return expected cost of failing over to a service."""
+        stats = self._stats.get(service_uuid)
+        if stats is None:
+            return ServiceStats().cost()
+        return stats.cost()
+
+    def rank(self, options, tuned=()):
+        """Return service options ordered best first.
+
+        Options on a mux in tuned need no retune and are preferred.
+        """
+        def option_cost(option):
+            """Return cost of a service option."""
+            cost = self.cost(option.service_uuid)
+            if option.mux_uuid in tuned:
+                cost -= SCHEDULER_RETUNE_COST
+            return cost
+        return sorted(options, key=option_cost)
+
+    def tried(self, channel):
+        """Return networks tried for a channel, most recent last."""
+        history = self._history.get(channel)
+        return list(history) if history else []
+
+    def _channel_history(self, channel):
+        """Return history of a channel, evicting the oldest channel."""
+        history = self._history.pop(channel, None)
+        if history is None:
+            history = deque(maxlen=SCHEDULER_HISTORY)
+            while len(self._history) >= SCHEDULER_CHANNELS:
+                self._history.popitem(last=False)
+        self._history[channel] = history
+        return history
+
+    def next_service(self, channel, options, current=None, tuned=()):
+        """Return network to fail over to, None if there is no other.
+
+        The current service is counted as failed.  Networks already
+        failed over from or to are skipped until every one has been.
+        Services on a mux in tuned are preferred.
+        """
+        history = self._channel_history(channel)
+        if current:
+            for option in options:
+                if option.name == current:
+                    self.record_failure(option.service_uuid)
+            if current in history:
+                history.remove(current)
+            history.append(current)
+
+        others = [option for option in options if option.name != current]
+        candidates = [option for option in others
+                      if option.name not in history]
+        if not candidates:
+            # Tried them all, start over from the best
+            _LOGGER.debug('All services of %s tried, resetting.', channel)
+            history.clear()
+            if current:
+                history.append(current)
+            candidates = others
+        if not candidates:
+            return None
+
+        best = self.rank(candidates, tuned)[0]
+        history.append(best.name)
+        _LOGGER.debug('Failing %s over to %s, cost %.2f%s',
+                      channel, best.name, self.cost(best.service_uuid),
+                      ', already tuned' if best.mux_uuid in tuned else '')
+        return best.name
+
+    def forget(self, channel):
+        """Drop the tried history of a channel."""
+        self._history.pop(channel, None)
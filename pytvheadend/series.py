@@ -0,0 +1,118 @@
+"""
+pytvheadend.series
+~~~~~~~~~~~~~~~~~~~~
+Fixed size time series of subscription counters
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import logging
+import math
+from array import array
+
+_LOGGER = logging.getLogger(__name__)
+
+_NAN = float('nan')
+
+
+def _present(values):
+    """Return values without missing samples."""
+    return [value for value in values if not math.isnan(value)]
+
+
+class RingSeries(object):
+    """Last samples of a set of counters, oldest overwritten first"""
+    def __init__(self, fields, size):
+        """Initialize ring buffers holding size samples per field."""
+        self.fields = tuple(fields)
+        self.size = int(size)
+        self._times = array('d', [_NAN]) * self.size
+        self._columns = {field: array('d', [_NAN]) * self.size
+                         for field in self.fields}
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        """Drop all samples."""
+        self._next = 0
+        self._count = 0
+
+    def append(self, timestamp, values):
+        """Add a sample, values maps field to number or None."""
+        if not self.size:
+            return
+        pos = self._next
+        self._times[pos] = timestamp
+        for field, column in self._columns.items():
+            value = values.get(field)
+            column[pos] = _NAN if value is None else value
+        self._next = (pos + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def _ordered(self, column):
+        """Return samples of a buffer oldest first."""
+        if self._count < self.size:
+            return column[:self._count]
+        return column[self._next:] + column[:self._next]
+
+    def times(self):
+        """Return sample times, oldest first."""
+        return self._ordered(self._times)
+
+    def values(self, field):
+        """Return samples of a field, oldest first, nan where missing."""
+        return self._ordered(self._columns[field])
+
+    def last_time(self):
+        """Return time of the newest sample, None if empty."""
+        if not self._count:
+            return None
+        return self._times[self._next - 1]
+
+    def last(self, field):
+        """Return newest sample of a field, None if missing."""
+        if not self._count:
+            return None
+        value = self._columns[field][self._next - 1]
+        return None if math.isnan(value) else value
+
+    def rates(self, field):
+        """Return per second increase of a counter between samples.
+
+        Intervals with a missing sample or a counter reset are skipped.
+        """
+        times = self.times()
+        values = self.values(field)
+        return [(value - prev) / (now - then) for then, now, prev, value
+                in zip(times, times[1:], values, values[1:])
+                if now > then and value >= prev]
+
+    def rate(self, field):
+        """Return mean per second increase of a counter over the window."""
+        rates = self.rates(field)
+        if not rates:
+            return None
+        return sum(rates) / len(rates)
+
+    def mean(self, field):
+        """Return mean of a field over the window."""
+        values = _present(self.values(field))
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+    def percentile(self, field, pct, rates=False):
+        """Return pct percentile of a field, or of its rates."""
+        values = self.rates(field) if rates else \
+            _present(self.values(field))
+        if not values:
+            return None
+        values.sort()
+        # Linear interpolation between closest ranks
+        rank = (len(values) - 1) * min(max(pct, 0), 100) / 100.0
+        low = int(rank)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (rank - low)
@@ -0,0 +1,74 @@
+"""
+pytvheadend.slots
+~~~~~~~~~~~~~~~~~~~~
+Assigns streams to a fixed set of external slots
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import logging
+from collections import OrderedDict
+
+from pytvheadend.constants import SLOT_MEMORY
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SlotAllocator(object):
+    """Free list of slot indexes, a key gets its last slot back if free"""
+    def __init__(self, size, grow=None, memory=SLOT_MEMORY):
+        """Initialize allocator with slots 0 to size - 1 free.
+
+        grow is called with the new index when all slots are taken,
+        without it allocation fails instead.
+        """
+        self._size = int(size)
+        self._grow = grow
+        self._memory = memory
+        # Free slots, longest free first so recent ones stay sticky
+        self._free = OrderedDict((index, None) for index in range(self._size))
+        # Last slot of each key, least recently allocated first
+        self._last = OrderedDict()
+
+    @property
+    def size(self):
+        """Return number of slots"""
+        return self._size
+
+    @property
+    def in_use(self):
+        """Return number of allocated slots"""
+        return self._size - len(self._free)
+
+    def last_slot(self, key):
+        """Return slot a key was last given, None if unknown."""
+        return self._last.get(key)
+
+    def allocate(self, key=None):
+        """Return a free slot index for key, None if none left."""
+        index = self._last.get(key)
+        if index is not None and index in self._free:
+            del self._free[index]
+        elif self._free:
+            index = self._free.popitem(last=False)[0]
+        elif self._grow is not None:
+            index = self._size
+            self._size += 1
+            _LOGGER.info('All slots in use, adding slot %s.', index)
+            self._grow(index)
+        else:
+            return None
+
+        if key is not None:
+            self._last.pop(key, None)
+            self._last[key] = index
+            while len(self._last) > self._memory:
+                self._last.popitem(last=False)
+        return index
+
+    def release(self, index):
+        """Return a slot to the free list."""
+        if index in self._free or not 0 <= index < self._size:
+            _LOGGER.debug('Slot %s is not allocated.', index)
+            return
+        self._free[index] = None
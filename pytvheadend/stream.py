@@ -6,16 +6,21 @@ Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
 Licensed under the MIT license.
 
 """
-import asyncio
 import json
 import logging
+import time
+
+from pytvheadend.constants import (
+    SERIES_FIELDS, SERIES_WINDOW, SERIES_INTERVAL)
+from pytvheadend.records import ServiceOption
+from pytvheadend.series import RingSeries
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class Stream(object):
     """TVHeadend stream object"""
-    def __init__(self, server):
+    def __init__(self, server, window=SERIES_WINDOW, clock=time.monotonic):
         """Initialize stream object."""
         self.server = server
         self._channel_name = None
@@ -24,6 +29,10 @@ class Stream(object):
         self._service_list = []
         self._service_history = []
 
+        # Recent subscription counters
+        self._clock = clock
+        self._series = RingSeries(SERIES_FIELDS, window or 0)
+
     @property
     def is_active(self):
         """Return if active or not"""
@@ -39,35 +48,108 @@ class Stream(object):
         """Return currently active service"""
         return self._active_service
 
+    @property
+    def series(self):
+        """Return recent byte and error counters"""
+        return self._series
+
+    @property
+    def bitrate(self):
+        """Return mean input bitrate over the window, bits per second"""
+        rate = self._series.rate('bytes_in')
+        return None if rate is None else rate * 8
+
+    @property
+    def error_rate(self):
+        """Return mean errors per second over the window"""
+        return self._series.rate('errors')
+
     @property
     def service_full_list(self):
         """Return list of services"""
         return self._service_list
 
+    @property
+    def active_mux(self):
+        """Return uuid of the mux carrying the active service"""
+        for service in self._service_list:
+            if service.active:
+                return service.mux_uuid
+        return None
+
+    @property
+    def tuned_inputs(self):
+        """Return names of inputs tuned to the active mux"""
+        mux_uuid = self.active_mux
+        if mux_uuid is None:
+            return []
+        return [inp.name for inp in self.server.get_mux_inputs(mux_uuid)]
+
+    def occupancy(self):
+        """Return tuner usage of the stream."""
+        mux_uuid = self.active_mux
+        return {
+            'mux': mux_uuid,
+            'inputs': self.tuned_inputs,
+            'shared_with': sum(
+                1 for strm in self.server.stream_list
+                if strm is not self and mux_uuid is not None and
+                strm.active_mux == mux_uuid),
+            }
+
+    @property
+    def channel_uuids(self):
+        """Return uuids of channels matching the channel name"""
+        return [chan.uuid for chan in
+                self.server.get_channels(self._channel_name)]
+
+    def now_next(self):
+        """Return current and next programme from the loaded guide."""
+        for uuid in self.channel_uuids:
+            programmes = self.server.epg.now_next(uuid)
+            if programmes != (None, None):
+                return programmes
+        return None, None
+
     @property
     def service_name_list(self):
         """Return list of service names"""
         tmp_list = []
         for service in self._service_list:
-            tmp_list.append(service['name'])
+            tmp_list.append(service.name)
         return tmp_list
 
     def update_data(self, channel=None):
-        """ Update subscription object. """
+        """ Update subscription object, return True if it changed. """
         if not channel:
+            changed = self._channel_name is not None
             self._channel_name = None
             self._active_service = None
             self._service_list = []
             self._service_history = []
+            self._series.clear()
             _LOGGER.debug('Stream object cleared.')
         else:
-            self._channel_name = channel['name']
-            if channel['network'] != self._active_service:
-                self._active_service = channel['network']
+            changed = channel.name != self._channel_name
+            self._channel_name = channel.name
+            if channel.network != self._active_service:
+                changed = True
+                self._active_service = channel.network
                 self._service_history.append(self._active_service)
                 self.get_channel_info()
+            self._record_sample(channel)
 
             _LOGGER.debug('Channel updated: %s', self._channel_name)
+        return changed
+
+    def _record_sample(self, channel):
+        """Add subscription counters to the series, at most per interval."""
+        now = self._clock()
+        last = self._series.last_time()
+        if last is not None and now - last < SERIES_INTERVAL:
+            return
+        self._series.append(now, {field: getattr(channel, field)
+                                  for field in SERIES_FIELDS})
 
     def get_channel_info(self):
         """Return list of services & muxes based on channel name"""
@@ -75,34 +157,39 @@ class Stream(object):
         if not self._channel_name:
             return
 
-        if not self.server.chan_json:
-            return
-
-        for chan in self.server.chan_json:
-            if chan['name'].upper() == self._channel_name:
-                for serv in chan['services']:
-                    for mux in self.server.serv_json:
-                        if mux['uuid'] == serv:
-                            if mux['network'].upper() == self._active_service:
-                                active = True
-                            else:
-                                active = False
-                            options.append({
-                                'name': mux['network'].upper(),
-                                'service_uuid': mux['uuid'],
-                                'mux_uuid': mux['multiplex_uuid'],
-                                'active': active,
-                                })
+        for chan in self.server.get_channels(self._channel_name):
+            for serv in chan.services:
+                mux = self.server.get_service(serv)
+                if mux is None:
+                    continue
+                options.append(ServiceOption(
+                    mux.network, mux.uuid, mux.mux_uuid,
+                    mux.network == self._active_service))
         self._service_list = options
 
     async def change_service(self, new_service=None):
         """Change active service"""
+        if not self._channel_name:
+            return
+
+        await self.server.switch_streams([(self, new_service)])
+
+    def next_service(self):
+        """Return best service to fail over to, None if no other"""
+        if not self._channel_name:
+            return None
+        return self.server.scheduler.next_service(
+            self._channel_name, self._service_list, self._active_service,
+            self.server.tuned_muxes)
+
+    def service_nodes(self, new_service=None):
+        """Return lists of service nodes to disable and re-enable"""
         disable_list = []
         enable_list = []
         service_valid = False
 
         if not self._channel_name:
-            return
+            return disable_list, enable_list
 
         # If no service is defined:
         # - Disable active and previously active services
@@ -111,20 +198,20 @@ class Stream(object):
             _LOGGER.debug('Changing to %s', new_service)
             # Disable all services except new one
             for network in self._service_list:
-                if network['name'] == new_service:
+                if network.name == new_service:
                     service_valid = True
                     _LOGGER.debug('Found Service')
 
             if service_valid:
                 for network in self._service_list:
-                    if network['name'] != new_service:
+                    if network.name != new_service:
                         disable_list.append({
                             "enabled": "false",
-                            "uuid": network['service_uuid']
+                            "uuid": network.service_uuid
                             })
                         enable_list.append({
                             "enabled": "true",
-                            "uuid": network['service_uuid']
+                            "uuid": network.service_uuid
                             })
         else:
             # Disable those we've already tried to get a new option
@@ -137,30 +224,14 @@ class Stream(object):
             for service in self._service_history:
                 # Build json with the service uuids to disable.
                 for network in self._service_list:
-                    if service == network['name']:
+                    if service == network.name:
                         disable_list.append({
                             "enabled": "false",
-                            "uuid": network['service_uuid']
+                            "uuid": network.service_uuid
                             })
                         enable_list.append({
                             "enabled": "true",
-                            "uuid": network['service_uuid']
+                            "uuid": network.service_uuid
                             })
         _LOGGER.debug(json.dumps(disable_list))
-
-        # http://192.168.11.5:9981/api/idnode/save
-        data = {'node': json.dumps(disable_list)}
-        req = await self.server.api_post(
-            self.server.root_url + "/api/idnode/save", params=None, data=data)
-        if req is None:
-            _LOGGER.error('Unable to disable services.')
-        else:
-            # Wait for service to switch
-            await asyncio.sleep(2)
-            # Renable all options
-            data = {'node': json.dumps(enable_list)}
-            req = await self.server.api_post(
-                self.server.root_url + "/api/idnode/save", params=None, data=data)
-
-        # Force update after we make a change
-        await self.server.fetch_subscription_list(force=True)
+        return disable_list, enable_list
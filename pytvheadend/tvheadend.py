@@ -7,19 +7,86 @@ Licensed under the MIT license.
 
 """
 
+import json
+import hashlib
 import logging
 import asyncio
+import random
+from collections import namedtuple
+from urllib.parse import urlsplit
 import aiohttp
 import async_timeout
 
+from pytvheadend.breaker import CircuitBreaker
+from pytvheadend.decoder import JSONDecoder
+from pytvheadend.epg import EPG
+from pytvheadend.grid import GridReader, grid_digest, grid_total
+from pytvheadend.records import (
+    Channel, Service, Mux, Subscription, Input, Event)
+from pytvheadend.scheduler import ServiceScheduler
+from pytvheadend.slots import SlotAllocator
 from pytvheadend.stream import Stream
 from pytvheadend.constants import (
     DEFAULT_TIMEOUT, DEFAULT_HEADERS, DEFAULT_PORT,
-    SUBSCRIPTIONS_URL, CHANNELS_URL, SERVICES_URL,
-    __version__)
+    DEFAULT_PAGE_SIZE, DEFAULT_PAGE_CONCURRENCY,
+    SUBSCRIPTIONS_URL, CHANNELS_URL, SERVICES_URL, MUXES_URL, INPUTS_URL,
+    IDNODE_SAVE_URL, IDNODE_LOAD_URL, IDNODE_DEBOUNCE, EPG_URL,
+    COMET_POLL_URL, COMET_WS_URL, COMET_SUBSCRIPTIONS, COMET_CHANNEL,
+    COMET_SERVICE, COMET_MUX, COMET_INPUTS, INPUT_REFRESH_INTERVAL,
+    COMET_EPG, EPG_MAX_AGE, EPG_NOTIFY_INTERVAL,
+    COMET_POLL_TIMEOUT, COMET_RETRY_INTERVAL,
+    COMET_HEARTBEAT, GRID_CHANNELS, GRID_SERVICES, GRID_MUXES,
+    CACHE_REFRESH_JITTER, CACHE_SAVE_DELAY, DEFAULT_SETTLE_TIMEOUT,
+    SETTLE_MIN_DELAY, SETTLE_MAX_DELAY, SETTLE_FIRST_FRACTION,
+    SETTLE_SMOOTHING, DEFAULT_POOL_SIZE,
+    DEFAULT_POOL_PER_HOST, DEFAULT_KEEPALIVE_TIMEOUT, DEFAULT_DNS_TTL,
+    AUTH_BASIC, AUTH_DIGEST, REQUEST_TIMEOUTS, RETRY_ATTEMPTS,
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_STATUSES, DECODE_OFFLOAD_SIZE,
+    SERIES_WINDOW, START_RETRY_INTERVAL,
+    CHANNEL_FIELDS, SERVICE_FIELDS, MUX_FIELDS, EPG_FIELDS, __version__)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Slot indexes affected by a subscription update
+StreamChanges = namedtuple('StreamChanges', ['added', 'removed', 'changed'])
+
+# Grid fetched for each idnode notification class
+_NOTIFY_GRIDS = {
+    COMET_CHANNEL: GRID_CHANNELS,
+    COMET_SERVICE: GRID_SERVICES,
+    COMET_MUX: GRID_MUXES,
+    }
+
+# Url, fields and record type of each grid
+_GRID_SOURCES = {
+    GRID_CHANNELS: (CHANNELS_URL, CHANNEL_FIELDS, Channel),
+    GRID_SERVICES: (SERVICES_URL, SERVICE_FIELDS, Service),
+    GRID_MUXES: (MUXES_URL, MUX_FIELDS, Mux),
+    }
+
+# Entry attribute, uuid lookup, all lookups, indexer and unindexer of
+# each grid, by attribute name
+_GRID_INDEXES = {
+    GRID_CHANNELS: ('chan_json', '_chan_uuid_index',
+                    ('_chan_index', '_chan_uuid_index'),
+                    '_index_channel', '_unindex_channel'),
+    GRID_SERVICES: ('serv_json', '_serv_index',
+                    ('_serv_index', '_mux_services', '_network_services'),
+                    '_index_service', '_unindex_service'),
+    GRID_MUXES: ('mux_json', '_mux_index', ('_mux_index',),
+                 '_index_mux', '_unindex_mux'),
+    }
+
+
+def _discard(index, key, record):
+    """Remove record from a list valued lookup, dropping empty keys."""
+    entries = index.get(key)
+    if entries is None or record not in entries:
+        return
+    entries.remove(record)
+    if not entries:
+        del index[key]
+
 
 # Workflow
 # Request active subscriptions, keep dictionary of active channel names
@@ -43,7 +110,17 @@ _LOGGER = logging.getLogger(__name__)
 class TVHeadend(object):
     """TVHeadend API object."""
     def __init__(self, host=None, port=DEFAULT_PORT,
-                 usr=None, pwd=None, maxconn=1, loop=None):
+                 usr=None, pwd=None, maxconn=1, loop=None,
+                 page_size=DEFAULT_PAGE_SIZE,
+                 page_concurrency=DEFAULT_PAGE_CONCURRENCY,
+                 cache_path=None, settle_timeout=DEFAULT_SETTLE_TIMEOUT,
+                 session=None, pool_size=DEFAULT_POOL_SIZE,
+                 pool_per_host=DEFAULT_POOL_PER_HOST,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 dns_ttl=DEFAULT_DNS_TTL, auth=AUTH_BASIC, metrics=False,
+                 subscription_ttl=0, timeouts=None, retries=RETRY_ATTEMPTS,
+                 json_backend=None, decode_offload=DECODE_OFFLOAD_SIZE,
+                 series_window=SERIES_WINDOW, grow_slots=False):
         """Initialize eight sleep class."""
 
         _LOGGER.debug("pyTVHeadend %s initializing new server at: %s",
@@ -59,17 +136,77 @@ class TVHeadend(object):
 
         self.root_url = 'http://{}:{}'.format(host, port)
 
+        self._page_size = page_size
+        self._page_concurrency = max(1, int(page_concurrency))
+
         self.chan_json = None
         self.serv_json = None
+        self.mux_json = None
+
+        # Lookup indexes, rebuilt on a full refresh and patched in place
+        # by incremental ones
+        self._chan_index = {}
+        self._chan_uuid_index = {}
+        self._serv_index = {}
+        self._mux_services = {}
+        self._network_services = {}
+        self._mux_index = {}
+
+        # Fastest installed JSON decoder, large payloads off the loop
+        self._decoder = JSONDecoder(json_backend, decode_offload, loop)
+
+        # Optional on-disk grid cache, sqlite is only loaded when used
+        self._cache = None
+        if cache_path:
+            from pytvheadend.cache import GridCache
+            self._cache = GridCache(cache_path, self._decoder.decode)
+        self._grid_digests = {}
+        self._cache_refresh_task = None
+        # Patched grids waiting to be written to the cache
+        self._dirty_grids = set()
+        self._cache_save_task = None
+
+        # Grid loading, in the background when started lazily
+        self._start_task = None
+        self._ready = False
+
+        # Tuned inputs and the muxes they carry
+        self._inputs = []
+        self._tuned_muxes = {}
+        self._inputs_fetched = None
+        self._mux_names = {}
+        self._mux_names_source = None
+
+        # Programme guide of loaded channels, current event per slot
+        self._epg = EPG()
+        self._slot_programmes = {}
+
+        # Incremental grid refresh, pending idnodes and page hashes
+        self._pending_nodes = {}
+        self._page_digests = {}
 
         self._active_list = []
 
         self._streams = {}
+        self._stream_data = {}
+        # Streams already reported as having no free slot
+        self._unslotted = set()
         self._active_subscriptions = []
 
+        # Single-flight subscription fetch and optional result reuse
+        self._subscription_ttl = subscription_ttl
+        self._subscription_task = None
+        self._subscriptions_fetched = None
+
+        self._series_window = series_window
         self._ext_list = [None] * int(maxconn)
         for xxx in range(int(maxconn)):
-            self._ext_list[xxx] = Stream(self)
+            self._ext_list[xxx] = Stream(self, series_window)
+
+        # Sticky slot assignment, optionally adding slots on overflow
+        self._slots = SlotAllocator(
+            maxconn, self._add_slot if grow_slots else None)
+        self._slot_callbacks = []
 
         if loop is None:
             _LOGGER.info("Must supply asyncio loop.  Quitting")
@@ -80,12 +217,69 @@ class TVHeadend(object):
 
         asyncio.set_event_loop(self._event_loop)
 
-        self._api_session = aiohttp.ClientSession(
-            headers=DEFAULT_HEADERS, loop=self._event_loop)
+        if session is None:
+            connector = aiohttp.TCPConnector(
+                limit=pool_size, limit_per_host=pool_per_host,
+                keepalive_timeout=keepalive_timeout,
+                ttl_dns_cache=dns_ttl, loop=self._event_loop)
+            self._api_session = aiohttp.ClientSession(
+                connector=connector, headers=DEFAULT_HEADERS,
+                loop=self._event_loop)
+            self._own_session = True
+        else:
+            # Shared session, e.g. Home Assistant's, is closed by its owner
+            self._api_session = session
+            self._own_session = False
+
+        # Credentials are sent with every request so they also work
+        # on a shared session
+        self._auth_kwargs = {}
+        self._ws_auth_kwargs = {}
+        if usr:
+            if auth == AUTH_DIGEST and hasattr(
+                    aiohttp, 'DigestAuthMiddleware'):
+                self._auth_kwargs['middlewares'] = (
+                    aiohttp.DigestAuthMiddleware(usr, pwd or ''),)
+            else:
+                if auth == AUTH_DIGEST:
+                    _LOGGER.error('Digest auth needs aiohttp >= 3.12, '
+                                  'using basic auth.')
+                self._auth_kwargs['auth'] = aiohttp.BasicAuth(usr, pwd or '')
+                self._ws_auth_kwargs = self._auth_kwargs
+
+        # Request timeouts by api path, retries and overload protection
+        self._timeouts = dict(REQUEST_TIMEOUTS)
+        self._timeouts.update(timeouts or {})
+        self._retries = max(1, int(retries))
+        self._breaker = CircuitBreaker(clock=self._event_loop.time)
+
+        # Observed service switch latency per network
+        self._settle_timeout = settle_timeout
+        self._switch_latency = {}
+
+        # Observed service quality, picks failover targets
+        self._scheduler = ServiceScheduler(self._event_loop.time)
+
+        # Switch in progress per stream, locks per stream slot and mux
+        self._switch_tasks = {}
+        self._switch_lock_map = {}
+        # Woken when a stream changes, to time switches seen by push
+        self._switch_waiters = set()
+
+        # Optional metrics, None when disabled
+        self._metrics = None
+        if metrics:
+            from pytvheadend.metrics import Metrics
+            self._metrics = Metrics()
 
         # Callbacks
         self._update_callbacks = []
 
+        # Push notifications
+        self._comet_task = None
+        self._push_active = False
+        self._refresh_tasks = {}
+
     @property
     def active_subscriptions(self):
         """Return list of current subscriptions."""
@@ -101,6 +295,75 @@ class TVHeadend(object):
         """Return external stream list"""
         return self._ext_list
 
+    @property
+    def inputs(self):
+        """Return list of tuned inputs"""
+        return self._inputs
+
+    @property
+    def tuned_muxes(self):
+        """Return dictionary of tuned mux uuid to inputs carrying it"""
+        return self._tuned_muxes
+
+    def occupancy(self):
+        """Return tuner occupancy of the server."""
+        return {
+            'inputs': len({inp.uuid for inp in self._inputs}),
+            'muxes': len(self._tuned_muxes),
+            'subscriptions': sum(inp.subs or 0 for inp in self._inputs),
+            'streams': len(self._streams),
+            }
+
+    @property
+    def epg(self):
+        """Return programme guide"""
+        return self._epg
+
+    @property
+    def switch_latency(self):
+        """Return average service switch latency per network"""
+        return self._switch_latency
+
+    @property
+    def scheduler(self):
+        """Return failover scheduler"""
+        return self._scheduler
+
+    @property
+    def breaker(self):
+        """Return request circuit breaker"""
+        return self._breaker
+
+    @property
+    def ready(self):
+        """Return if grids are loaded and streams resolved"""
+        return self._ready
+
+    @property
+    def push_active(self):
+        """Return if push notifications are being received"""
+        return self._push_active
+
+    def metrics(self):
+        """Return snapshot of collected metrics, None if disabled."""
+        if self._metrics is None:
+            return None
+        return self._metrics.snapshot()
+
+    def _observe_request(self, url, start, response):
+        """Record a completed request if metrics are enabled."""
+        if self._metrics is not None:
+            self._metrics.observe_request(
+                urlsplit(str(url)).path, self._event_loop.time() - start,
+                response.content.total_bytes)
+
+    def _request_failed(self, url, err=None):
+        """Record a failed request if metrics are enabled."""
+        if self._metrics is not None:
+            self._metrics.request_error(
+                urlsplit(str(url)).path,
+                timeout=isinstance(err, asyncio.TimeoutError))
+
     def add_update_callback(self, callback):
         """Register as callback for when a stream changes."""
         self._update_callbacks.append(callback)
@@ -113,54 +376,750 @@ class TVHeadend(object):
             _LOGGER.debug('Removed update callback %s',
                           callback)
 
+    def add_slot_callback(self, callback):
+        """Register as callback for when a stream slot is added."""
+        self._slot_callbacks.append(callback)
+        _LOGGER.debug('Added slot callback to %s', callback)
+
+    def remove_slot_callback(self, callback):
+        """ Remove a registered slot callback. """
+        if callback in self._slot_callbacks:
+            self._slot_callbacks.remove(callback)
+            _LOGGER.debug('Removed slot callback %s', callback)
+
+    def _add_slot(self, index):
+        """Add a stream slot when all are in use."""
+        self._ext_list.append(Stream(self, self._series_window))
+        for callback in self._slot_callbacks:
+            self._event_loop.call_soon(callback, index)
+
     def _do_update_callback(self, msg):
         """Call registered callback functions."""
+        for waiter in self._switch_waiters:
+            waiter.set()
         for callback in self._update_callbacks:
             _LOGGER.debug('Update callback %s by %s',
                           callback, msg)
             self._event_loop.call_soon(callback, msg)
 
-    async def start(self):
-        """Start api initialization."""
+    async def start(self, lazy=False):
+        """Start api initialization.
 
-        await self.fetch_channel_list()
-        await self.fetch_service_list()
+        With lazy set grids load in a background task, retried until
+        they arrive, and ready turns True once streams are resolved.
+        """
+        if not lazy:
+            await self._load_grids(retry=False)
+        elif self._start_task is None:
+            self._start_task = self._event_loop.create_task(
+                self._load_grids(retry=True))
         return True
 
+    async def wait_ready(self):
+        """Wait until grids are loaded."""
+        if self._start_task is not None:
+            await asyncio.shield(self._start_task)
+
+    async def _load_grids(self, retry):
+        """Load grids from the cache or server, then resolve streams."""
+        if self._cache is not None and await self.load_cached_grids():
+            # Serve cached grids now, revalidate in the background
+            self._cache_refresh_task = self._event_loop.create_task(
+                self._delayed_refresh(
+                    random.uniform(0, CACHE_REFRESH_JITTER)))
+        else:
+            await self.refresh_grids()
+            while retry and (self.chan_json is None or
+                             self.serv_json is None):
+                _LOGGER.info('Grids not loaded, retrying in %ss.',
+                             START_RETRY_INTERVAL)
+                await asyncio.sleep(START_RETRY_INTERVAL)
+                await self.refresh_grids()
+
+        # Streams placed before the grids arrived get their services now
+        self._ready = True
+        self._refresh_stream_info()
+        for index in sorted(self._streams.values()):
+            self._do_update_callback(index)
+
+    async def refresh_grids(self):
+        """Refetch all grids and refresh streams using them."""
+        await asyncio.gather(
+            self.fetch_channel_list(),
+            self.fetch_service_list(),
+            self.fetch_mux_list())
+        self._refresh_stream_info()
+
+    async def _delayed_refresh(self, delay):
+        """Refresh grids after a delay."""
+        await asyncio.sleep(delay)
+        await self.refresh_grids()
+
+    async def load_cached_grids(self):
+        """Load grids from the on-disk cache, return True if complete."""
+        grids = {}
+        for grid, record in ((GRID_CHANNELS, Channel.from_entry),
+                             (GRID_SERVICES, Service.from_entry),
+                             (GRID_MUXES, Mux.from_entry)):
+            cached = await self._event_loop.run_in_executor(
+                None, self._cache.load, self.root_url, grid, record)
+            if cached is None:
+                _LOGGER.debug('No cached %s grid, fetching grids.', grid)
+                return False
+            grids[grid] = cached
+
+        self.chan_json, self._grid_digests[GRID_CHANNELS] = \
+            grids[GRID_CHANNELS]
+        self.serv_json, self._grid_digests[GRID_SERVICES] = \
+            grids[GRID_SERVICES]
+        self.mux_json, self._grid_digests[GRID_MUXES] = grids[GRID_MUXES]
+        self.build_channel_index()
+        self.build_service_index()
+        self.build_mux_index()
+        return True
+
+    def _grid_changed(self, grid, entries):
+        """Return True if grid content differs, caching the new copy."""
+        if self._cache is None:
+            # Digests only serve the cache, a new fetch always replaces
+            return True
+
+        digest = grid_digest(entries)
+        if self._grid_digests.get(grid) == digest:
+            _LOGGER.debug('No change in %s grid.', grid)
+            return False
+
+        self._grid_digests[grid] = digest
+        self._event_loop.run_in_executor(
+            None, self._cache.save, self.root_url, grid, entries, digest)
+        return True
+
+    def _mark_grid_dirty(self, grid):
+        """Schedule a patched grid to be written to the cache."""
+        if self._cache is None:
+            return
+        self._dirty_grids.add(grid)
+        if self._cache_save_task is not None:
+            # Restart the delay, a burst of patches is saved once
+            self._cache_save_task.cancel()
+        self._cache_save_task = self._event_loop.create_task(
+            self._delayed_cache_save(CACHE_SAVE_DELAY))
+
+    async def _delayed_cache_save(self, delay):
+        """Write dirty grids to the cache after a delay."""
+        await asyncio.sleep(delay)
+        self._cache_save_task = None
+        await self._save_dirty_grids()
+
+    async def _save_dirty_grids(self):
+        """Hash and write dirty grids to the cache off the event loop."""
+        while self._dirty_grids:
+            grid = self._dirty_grids.pop()
+            entries = getattr(self, self._grid_state(grid)[0])
+            self._grid_digests[grid] = await self._event_loop.run_in_executor(
+                None, self._save_grid, grid, entries)
+
+    def _save_grid(self, grid, entries):
+        """Write a grid to the cache, return its digest."""
+        digest = grid_digest(entries)
+        self._cache.save(self.root_url, grid, entries, digest)
+        return digest
+
     async def stop(self):
         """Stop api session."""
-        _LOGGER.debug('Closing tvheadend session.')
-        await self._api_session.close()
+        if self._cache_save_task is not None:
+            # Write pending patches now rather than lose them
+            self._cache_save_task.cancel()
+            self._cache_save_task = None
+            await self._save_dirty_grids()
+        if self._start_task is not None:
+            self._start_task.cancel()
+            self._start_task = None
+        if self._cache_refresh_task is not None:
+            self._cache_refresh_task.cancel()
+            self._cache_refresh_task = None
+        await self.stop_notifications()
+        # Cancelled switches still re-enable their services
+        switches = set(self._switch_tasks.values())
+        for task in switches:
+            task.cancel()
+        for task in switches:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._subscription_task is not None:
+            self._subscription_task.cancel()
+            self._subscription_task = None
+        if self._own_session:
+            _LOGGER.debug('Closing tvheadend session.')
+            await self._api_session.close()
 
-    async def fetch_subscription_list(self, force=False):
-        """Fetch list of active stream subscriptions"""
+    async def start_notifications(self):
+        """Start listening for comet push notifications."""
+        if self._comet_task is None or self._comet_task.done():
+            self._comet_task = self._event_loop.create_task(
+                self._comet_listen())
+
+    async def stop_notifications(self):
+        """Stop listening for comet push notifications."""
+        self._push_active = False
+        tasks = list(self._refresh_tasks.values())
+        if self._comet_task is not None:
+            tasks.append(self._comet_task)
+            self._comet_task = None
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error('Notification task failed. %s', err)
+        self._refresh_tasks = {}
+
+    async def _comet_listen(self):
+        """Receive notifications, websocket first then long-poll."""
+        use_ws = True
+        try:
+            while True:
+                try:
+                    if use_ws:
+                        await self._comet_websocket()
+                    else:
+                        await self._comet_poll()
+                except aiohttp.WSServerHandshakeError as err:
+                    _LOGGER.info('Comet websocket unavailable, '
+                                 'using long-poll. %s', err)
+                    use_ws = False
+                    continue
+                except (aiohttp.ClientError, asyncio.TimeoutError,
+                        ConnectionRefusedError, ValueError, KeyError) as err:
+                    _LOGGER.error('Comet notifications unavailable. %s', err)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('Unexpected error in comet listener.')
+
+                # Polling takes over until we reconnect
+                self._push_active = False
+                await asyncio.sleep(COMET_RETRY_INTERVAL)
+        finally:
+            self._push_active = False
+
+    async def _comet_websocket(self):
+        """Receive notifications over the comet websocket."""
+        async with self._api_session.ws_connect(
+                self.root_url + COMET_WS_URL, heartbeat=COMET_HEARTBEAT,
+                **self._ws_auth_kwargs) as websocket:
+            _LOGGER.debug('Comet websocket connected.')
+            self._comet_connected()
+            async for msg in websocket:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    self._handle_comet(self._decoder.decode(msg.data))
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    raise aiohttp.ClientError(websocket.exception())
+        _LOGGER.debug('Comet websocket closed.')
+
+    async def _comet_poll(self):
+        """Receive notifications over comet long-poll."""
+        data = {'boxid': '', 'immediate': '1'}
+        while True:
+            with async_timeout.timeout(COMET_POLL_TIMEOUT,
+                                       loop=self._event_loop):
+                post = await self._api_session.post(
+                    self.root_url + COMET_POLL_URL, data=data,
+                    **self._auth_kwargs)
+                if post.status != 200:
+                    post.release()
+                    raise aiohttp.ClientResponseError(
+                        post.request_info, post.history,
+                        status=post.status, message='Comet poll failed')
+                result = self._decoder.decode(await post.read())
+
+            if not self._push_active:
+                _LOGGER.debug('Comet long-poll connected.')
+                self._comet_connected()
+            data = {'boxid': result['boxid'], 'immediate': '0'}
+            self._handle_comet(result)
+
+    def _comet_connected(self):
+        """Resync state missed while not connected."""
+        self._push_active = True
+        self._schedule_refresh(COMET_SUBSCRIPTIONS)
+
+    def _handle_comet(self, result):
+        """Apply a batch of comet notifications."""
+        for msg in result.get('messages', []):
+            notify = msg.get('notificationClass')
+            if notify == COMET_SUBSCRIPTIONS:
+                if not msg.get('updateEntry'):
+                    # Created, removed or reloaded, pick up the new list
+                    self._schedule_refresh(COMET_SUBSCRIPTIONS)
+                elif 'channel' in msg:
+                    # Sent every second per subscription, never refetch
+                    # for grabbers, scans or subscriptions still tuning
+                    channel = self._parse_subscription(msg)
+                    if channel is not None:
+                        self._apply_subscription(channel)
+            elif notify in _NOTIFY_GRIDS:
+                self._queue_nodes(notify, msg)
+            elif notify in (COMET_INPUTS, COMET_EPG):
+                self._schedule_refresh(notify)
+
+    def _schedule_refresh(self, notify):
+        """Coalesce refetches triggered by notifications."""
+        task = self._refresh_tasks.get(notify)
+        if task is not None and not task.done():
+            return
+        if notify == COMET_SUBSCRIPTIONS:
+            coro = self.fetch_subscription_list(max_age=0)
+        elif notify == COMET_INPUTS:
+            coro = self.fetch_input_list(max_age=INPUT_REFRESH_INTERVAL)
+        elif notify == COMET_EPG:
+            coro = self.fetch_stream_epg(max_age=EPG_NOTIFY_INTERVAL)
+        else:
+            coro = self._refresh_grid(notify)
+        self._refresh_tasks[notify] = self._event_loop.create_task(coro)
+
+    async def _refresh_grid(self, notify):
+        """Refetch a grid and refresh streams using it."""
+        if notify == COMET_CHANNEL:
+            await self.fetch_channel_list()
+        elif notify == COMET_SERVICE:
+            await self.fetch_service_list()
+        else:
+            await self.fetch_mux_list()
+        self._refresh_stream_info()
+
+    def _queue_nodes(self, notify, msg):
+        """Collect changed idnodes of a grid for an incremental refresh."""
+        if not any(key in msg for key in ('create', 'change', 'delete')):
+            # No uuids given, reload the whole grid
+            self._schedule_refresh(notify)
+            return
+
+        changed, deleted = self._pending_nodes.setdefault(
+            notify, (set(), set()))
+        for key in ('create', 'change'):
+            for uuid in msg.get(key) or ():
+                changed.add(uuid)
+                deleted.discard(uuid)
+        for uuid in msg.get('delete') or ():
+            deleted.add(uuid)
+            changed.discard(uuid)
+
+        key = (notify, 'nodes')
+        task = self._refresh_tasks.get(key)
+        if task is None or task.done():
+            self._refresh_tasks[key] = self._event_loop.create_task(
+                self._drain_nodes(notify))
+
+    async def _drain_nodes(self, notify):
+        """Load queued idnodes until no more changes arrive."""
+        while self._pending_nodes.get(notify):
+            # Let a burst of notifications collect into one request
+            await asyncio.sleep(IDNODE_DEBOUNCE)
+            changed, deleted = self._pending_nodes.pop(notify)
+            if await self.refresh_nodes(
+                    _NOTIFY_GRIDS[notify], changed, deleted) is None:
+                self._schedule_refresh(notify)
+
+    def _refresh_stream_info(self, indexes=None):
+        """Recompute service lists of active streams, or only indexes."""
+        if indexes is None:
+            indexes = self._streams.values()
+        for index in indexes:
+            strm = self._ext_list[index]
+            services = strm.service_full_list
+            strm.get_channel_info()
+            if strm.service_full_list != services:
+                self._do_update_callback(index)
+
+    def _apply_subscription(self, channel):
+        """Apply a single subscription update."""
+        stream_name = channel.stream_name
+        if stream_name not in self._streams:
+            if stream_name not in self._unslotted:
+                # Could not be parsed when created, place it once now
+                self._schedule_refresh(COMET_SUBSCRIPTIONS)
+            return
+
+        for pos, sub in enumerate(self._active_subscriptions):
+            if sub.id == channel.id:
+                self._active_subscriptions[pos] = channel
+                break
+
+        if channel == self._stream_data.get(stream_name):
+            return
+        self._stream_data[stream_name] = channel
+        index = self._streams[stream_name]
+        changed = self._ext_list[index].update_data(channel)
+        self._observe_errors(self._ext_list[index], channel)
+        if changed:
+            self._do_update_callback(index)
+
+    async def fetch_subscription_list(self, force=False, max_age=None):
+        """Fetch list of active stream subscriptions.
+
+        Concurrent callers share a single request.  A result fetched
+        less than max_age seconds ago (default subscription_ttl) is
+        reused, pass max_age=0 to always fetch.
+        """
+        loop = self._event_loop
+        if max_age is None:
+            max_age = self._subscription_ttl
+
+        if max_age and self._subscriptions_fetched is not None and \
+                loop.time() - self._subscriptions_fetched < max_age:
+            _LOGGER.debug('Reusing subscriptions fetched %.1fs ago.',
+                          loop.time() - self._subscriptions_fetched)
+            changes = StreamChanges([], [], [])
+        else:
+            task = self._subscription_task
+            if task is None or task.done():
+                task = self._subscription_task = loop.create_task(
+                    self._timed_fetch_subscription_list())
+            else:
+                _LOGGER.debug('Joining subscription fetch in flight.')
+            changes = await asyncio.shield(task)
+
+        if force and changes is not None:
+            notified = set(changes.added).union(
+                changes.removed, changes.changed)
+            for index in sorted(set(self._streams.values()) - notified):
+                self._do_update_callback(index)
+        return changes
+
+    async def _timed_fetch_subscription_list(self):
+        """Fetch subscriptions, recording poll time if enabled"""
+        if self._metrics is None:
+            return await self._fetch_subscription_list()
+
+        start = self._event_loop.time()
+        changes = await self._fetch_subscription_list()
+        self._metrics.observe('poll', self._event_loop.time() - start)
+        return changes
+
+    async def _fetch_subscription_list(self):
+        """Fetch subscriptions and update stream slots"""
         # url = '{}/users/me'.format(API_URL)
         streams = []
 
         slist = await self.api_get(self.root_url + SUBSCRIPTIONS_URL,
                                    {'start': '0', 'limit': '999999999'})
-        if slist is None:
+        if not isinstance(slist, dict) or 'entries' not in slist:
+            # Keep the last known streams rather than clearing them
             _LOGGER.error('Unable to fetch subscriptions.')
-        else:
-            # self._devices = dlist['user']['devices']
-            # _LOGGER.debug('RAW: %s', slist)
-            # _LOGGER.debug('RAW: %s', slist['entries'])
-            for chann in slist['entries']:
-                try:
-                    streams.append({
-                        'id': chann['id'],
-                        'name': chann['channel'].upper(),
-                        'network': chann['service'].split("/")[1].upper(),
-                        })
-                except KeyError as err:
-                    _LOGGER.debug('Error adding stream to list: %s', err)
+            return None
+
+        # self._devices = dlist['user']['devices']
+        # _LOGGER.debug('RAW: %s', slist)
+        # _LOGGER.debug('RAW: %s', slist['entries'])
+        for chann in slist['entries']:
+            channel = self._parse_subscription(chann)
+            if channel is not None:
+                streams.append(channel)
 
         self._active_subscriptions = streams
+        self._subscriptions_fetched = self._event_loop.time()
         # _LOGGER.debug(streams)
-        self.update_stream_list(streams, force)
-        log_str = ""
-        for index, obj in enumerate(self._ext_list):
-            log_str = log_str + 'Pos: {} - Name: {}, '.format(index, obj.channel_name)
+        return self.update_stream_list(streams)
+
+    async def change_services(self, mapping):
+        """Change active service of many streams in one round-trip.
+
+        mapping is a dict, or list of pairs, of stream index to target
+        service name.  A target of None fails over to the best service.
+        A slot listed more than once switches to its last target.
+        """
+        if hasattr(mapping, 'items'):
+            mapping = mapping.items()
+        slots = {}
+        for index, target in mapping:
+            try:
+                slot = int(index)
+            except (TypeError, ValueError):
+                slot = -1
+            if not 0 <= slot < len(self._ext_list):
+                _LOGGER.error('No stream slot %s, not switching it.', index)
+                continue
+            if slot in slots:
+                _LOGGER.warning('Stream slot %s listed twice, dropping '
+                                'target %s.', slot, slots[slot])
+            slots[slot] = target
+        if slots:
+            await self.switch_streams(
+                [(self._ext_list[slot], target)
+                 for slot, target in slots.items()])
+
+    async def switch_streams(self, targets):
+        """Change active service of a list of (stream, target) pairs.
+
+        A pending switch covering only streams in targets is cancelled
+        and replaced, others are waited for through the stream and mux
+        locks.
+        """
+        # Drop repeated pairs, keeping the order they were given in
+        targets = [(strm, target) for strm, target
+                   in dict.fromkeys(targets) if strm.is_active]
+        if not targets:
+            _LOGGER.debug('No active streams to switch.')
+            return
+
+        streams = {strm for strm, _ in targets}
+        task = self._event_loop.create_task(self._locked_switch(targets))
+        for old in set(self._switch_tasks.get(strm) for strm in streams):
+            if old is None or old.done():
+                continue
+            if all(strm in streams for strm, pending
+                   in self._switch_tasks.items() if pending is old):
+                _LOGGER.debug('Superseding pending service switch.')
+                old.cancel()
+        for strm in streams:
+            self._switch_tasks[strm] = task
+
+        def switch_done(done):
+            """Forget the switch once it has finished."""
+            for strm in streams:
+                if self._switch_tasks.get(strm) is done:
+                    del self._switch_tasks[strm]
+        task.add_done_callback(switch_done)
+
+        # Waiting keeps the switch running if our caller goes away
+        await asyncio.wait([task])
+        if task.cancelled():
+            _LOGGER.debug('Service switch superseded.')
+            return
+        task.result()
+
+    def _switch_locks(self, streams):
+        """Return locks of streams and their muxes in acquire order."""
+        muxes = set()
+        for strm in streams:
+            muxes.update(service.mux_uuid or service.service_uuid
+                         for service in strm.service_full_list)
+        # Same global order everywhere, stream slots before muxes
+        # A stream listed twice must not take its lock twice
+        keys = sorted({('stream', self._ext_list.index(strm))
+                       for strm in streams})
+        keys.extend(('mux', mux) for mux in sorted(muxes))
+        return [self._switch_lock_map.setdefault(key, asyncio.Lock())
+                for key in keys]
+
+    async def _locked_switch(self, targets):
+        """Switch streams while holding their stream and mux locks."""
+        acquired = []
+        try:
+            for lock in self._switch_locks([strm for strm, _ in targets]):
+                await lock.acquire()
+                acquired.append(lock)
+            if not all(target for _, target in targets):
+                # Failover prefers tuned muxes, know which they are
+                await self.fetch_input_list()
+            disable_list, enable_list, streams = \
+                self._switch_nodes(targets)
+            await self.switch_services(disable_list, enable_list, streams)
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    @staticmethod
+    def _switch_nodes(targets):
+        """Return merged disable and enable nodes and switching streams."""
+        disable_list = []
+        enable_list = []
+        keep = set()
+        seen = set()
+        streams = []
+        for strm, target in targets:
+            if not strm.is_active:
+                # Ended while waiting for the locks
+                continue
+            streams.append(strm)
+            if not target:
+                # Fail over to the best service seen for the channel
+                target = strm.next_service()
+            if target:
+                # Never disable a service another stream is switching to
+                keep.update(service.service_uuid for service
+                            in strm.service_full_list
+                            if service.name == target)
+            disable, enable = strm.service_nodes(target)
+            for node, enable_node in zip(disable, enable):
+                if node['uuid'] not in seen:
+                    seen.add(node['uuid'])
+                    disable_list.append(node)
+                    enable_list.append(enable_node)
+
+        disable_list = [node for node in disable_list
+                        if node['uuid'] not in keep]
+        enable_list = [node for node in enable_list
+                       if node['uuid'] not in keep]
+        return disable_list, enable_list, streams
+
+    async def switch_services(self, disable_list, enable_list, streams=None):
+        """Disable services, wait for the switch, then re-enable them."""
+        if not disable_list:
+            _LOGGER.debug('No services to disable.')
+            return
+
+        if self._metrics is None:
+            await self._switch_services(disable_list, enable_list, streams)
+            return
+
+        start = self._event_loop.time()
+        await self._switch_services(disable_list, enable_list, streams)
+        self._metrics.observe(
+            'change_service', self._event_loop.time() - start)
+        self._metrics.count('service_switches')
+
+    async def _switch_services(self, disable_list, enable_list, streams):
+        """Post disable, wait for settle, post enable and refetch."""
+
+        # http://192.168.11.5:9981/api/idnode/save
+        data = {'node': json.dumps(disable_list)}
+        disable = self._event_loop.create_task(self.api_post(
+            self.root_url + IDNODE_SAVE_URL, params=None, data=data,
+            retry=True))
+        try:
+            if await asyncio.shield(disable) is None:
+                _LOGGER.error('Unable to disable services.')
+            else:
+                # Wait for service to switch
+                await self._wait_for_switch(
+                    streams or [], {node['uuid'] for node in disable_list})
+        finally:
+            # Renable all options, also when the switch is superseded
+            await asyncio.shield(self._enable_services(disable, enable_list))
+
+        # Force update after we make a change
+        await self.fetch_subscription_list(force=True, max_age=0)
+
+    async def _enable_services(self, disable, enable_list):
+        """Re-enable services once the disable request has finished."""
+        if await disable is None:
+            return
+        # Not stopped by the breaker, services must not stay disabled
+        data = {'node': json.dumps(enable_list)}
+        req = await self.api_post(
+            self.root_url + IDNODE_SAVE_URL, params=None, data=data,
+            retry=True, breaker=False)
+        if req is None:
+            _LOGGER.error('Unable to re-enable services.')
+
+    async def _wait_for_switch(self, streams, disabled):
+        """Wait until streams move off the disabled services."""
+        loop = self._event_loop
+        start = loop.time()
+        deadline = start + self._settle_timeout
+
+        pending = {}
+        candidates = set()
+        for strm in streams:
+            names = {service.name for service in strm.service_full_list
+                     if service.service_uuid in disabled}
+            if strm.active_service not in names:
+                # Not on a disabled service, nothing to wait for
+                continue
+            pending[strm] = names
+            candidates.update(
+                service.name for service in strm.service_full_list
+                if service.name not in names)
+
+        # First poll well before the fastest switch seen so far on a
+        # candidate network, so a faster switch is seen and averaged in
+        known = [self._switch_latency[name] for name in candidates
+                 if name in self._switch_latency]
+        delay = SETTLE_MIN_DELAY
+        if known:
+            delay = min(max(min(known) * SETTLE_FIRST_FRACTION, delay),
+                        SETTLE_MAX_DELAY)
+
+        waiter = asyncio.Event()
+        self._switch_waiters.add(waiter)
+        try:
+            await self._poll_for_switch(pending, start, deadline, delay,
+                                        waiter)
+        finally:
+            self._switch_waiters.discard(waiter)
+
+    async def _poll_for_switch(self, pending, start, deadline, delay,
+                               waiter):
+        """Check pending streams until they switch or time runs out."""
+        loop = self._event_loop
+        checked = start
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                _LOGGER.warning('Service switch not seen after %ss.',
+                                self._settle_timeout)
+                for strm, names in pending.items():
+                    self._record_failed_switch(strm, names)
+                return
+            if self._push_active:
+                # Wake as the change arrives, time out to recheck
+                waiter.clear()
+                try:
+                    await asyncio.wait_for(
+                        waiter.wait(), min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                seen = loop.time()
+            else:
+                await asyncio.sleep(min(delay, remaining))
+                await self.fetch_subscription_list(max_age=0)
+                # The change happened between this poll and the last
+                seen = (checked + loop.time()) / 2
+            checked = loop.time()
+
+            elapsed = seen - start
+            for strm, names in list(pending.items()):
+                if strm.is_active and strm.active_service in names:
+                    continue
+                del pending[strm]
+                if strm.is_active:
+                    self._record_switch(strm.active_service, elapsed)
+                    for service in strm.service_full_list:
+                        if service.active:
+                            self._scheduler.record_lock(
+                                service.service_uuid, elapsed)
+                else:
+                    self._record_failed_switch(strm, names)
+            delay = min(delay * 2, SETTLE_MAX_DELAY)
+
+    def _record_failed_switch(self, strm, disabled):
+        """Count a switch failure against the services left enabled."""
+        for service in strm.service_full_list:
+            if service.name not in disabled:
+                self._scheduler.record_failure(service.service_uuid)
+
+    def _observe_errors(self, strm, channel):
+        """Feed the error counter of a subscription to the scheduler."""
+        if channel.errors is None:
+            return
+        for service in strm.service_full_list:
+            if service.active:
+                self._scheduler.record_errors(
+                    service.service_uuid, channel.errors)
+                return
+
+    def _record_switch(self, network, latency):
+        """Add observed switch latency to the network average."""
+        average = self._switch_latency.get(network)
+        if average is not None:
+            latency = average + SETTLE_SMOOTHING * (latency - average)
+        self._switch_latency[network] = latency
+        _LOGGER.debug('Switch to %s settled, average %.2fs',
+                      network, latency)
+
+    @staticmethod
+    def _parse_subscription(chann):
+        """Return subscription record from subscription entry"""
+        try:
+            return Subscription.from_entry(chann)
+        except (KeyError, IndexError, AttributeError) as err:
+            _LOGGER.debug('Error adding stream to list: %s', err)
+            return None
 
 # [{
 #   'channel': 'Channel Name',
@@ -171,163 +1130,715 @@ class TVHeadend(object):
 #  {ext_list_index: stream_name}
 #
 #   Loop through active channel list, see if each channel is in the dictionary
-#       If not:  Add it - (helper function to get highest empty index)
+#       If not:  Add it - (slot allocator, channel's last slot if free)
 #       If so: update
 
-    def next_index(self):
-        """Return next available index to assign stream"""
-        for index, strm in enumerate(self._ext_list):
-            if not strm.channel_name:
-                # Index is free
-                # _LOGGER.debug('Returning available index: %s', index)
-                return index
-
-    def update_stream_list(self, streams, force):
-        """ Update device list. """
+    def update_stream_list(self, streams, force=False):
+        """Update stream slots from subscriptions, return change set."""
         if streams is None:
             _LOGGER.error('Error updating TVHeadend streams, no data.')
-            return
+            return None
+
+        if self._metrics is None:
+            return self._update_stream_list(streams, force)
+
+        start = self._event_loop.time()
+        changes = self._update_stream_list(streams, force)
+        self._metrics.observe(
+            'update_stream_list', self._event_loop.time() - start)
+        self._metrics.count('streams_added', len(changes.added))
+        self._metrics.count('streams_removed', len(changes.removed))
+        self._metrics.count('streams_changed', len(changes.changed))
+        return changes
+
+    def _update_stream_list(self, streams, force):
+        """Diff subscriptions against stream slots"""
 
-        active_streams = []
+        current = {}
         for channel in streams:
-            stream_name = '{}.{}'.format(channel['id'], channel['name'])
-            active_streams.append(stream_name)
+            current[channel.stream_name] = channel
 
+        changes = StreamChanges([], [], [])
+
+        # Clear ended streams first so their slots can be reused
+        for stream_name in self._streams.keys() - current.keys():
+            _LOGGER.debug('Old stream: %s. Removing from stream dict.',
+                          stream_name)
+            index = self._streams.pop(stream_name)
+            self._stream_data.pop(stream_name, None)
+            self._ext_list[index].update_data()
+            self._slots.release(index)
+            changes.removed.append(index)
+        self._unslotted &= current.keys()
+
+        for stream_name, channel in current.items():
             if stream_name not in self._streams:
-                _LOGGER.debug('New stream: %s. Adding to stream list.',
-                              stream_name)
-                index = self.next_index()
+                index = self._slots.allocate(channel.name)
+                if index is None:
+                    if stream_name not in self._unslotted:
+                        self._unslotted.add(stream_name)
+                        _LOGGER.warning('No free slot for stream: %s',
+                                        stream_name)
+                    continue
+                self._unslotted.discard(stream_name)
+                _LOGGER.debug('New stream: %s. Adding to slot %s.',
+                              stream_name, index)
                 self._streams[stream_name] = index
-                _LOGGER.debug(self._streams)
-                # new = Stream(self)
-                # self._streams[stream_name] = new
-                # new_streams.append(new)
-
-            # Update no matter what
-            self._ext_list[self._streams[stream_name]].update_data(channel)
-            if force:
-                self._do_update_callback(self._streams[stream_name])
-            # self._streams[stream_name].update_data(channel)
-
-        # Need to check for no longer active streams and remove
-        tmp_strm = self._streams.copy()
-        try:
-            for stream, index in tmp_strm.items():
-                # _LOGGER.debug('1Stream index: %s, Channel: %s', index, stream)
-                if stream not in active_streams:
-                    # stream no longer active
-                    _LOGGER.debug('Old stream: %s. Removing from stream dict.',
-                                  stream)
-                    # self._streams.pop(stream_id)
-                    del self._streams[stream]
-                    self._ext_list[index].update_data()
-                    # _LOGGER.debug(self._streams)
-        except Exception as err:
-            # This is a bad idea
-            _LOGGER.debug('Caught: %s', err)
+                self._ext_list[index].update_data(channel)
+                self._observe_errors(self._ext_list[index], channel)
+                changes.added.append(index)
+            elif channel != self._stream_data.get(stream_name):
+                index = self._streams[stream_name]
+                if self._ext_list[index].update_data(channel):
+                    changes.changed.append(index)
+                self._observe_errors(self._ext_list[index], channel)
+            self._stream_data[stream_name] = channel
+
+        if force:
+            notify = set(self._streams.values()).union(changes.removed)
+        else:
+            notify = set(changes.added).union(
+                changes.removed, changes.changed)
+        for index in sorted(notify):
+            self._do_update_callback(index)
+        return changes
 
     async def fetch_channel_list(self):
         """Fetch channel list"""
-        result = await self.api_get(self.root_url + CHANNELS_URL, {'start': '0', 'limit': '999999999'})
-        if result is None:
-            _LOGGER.error('Unable to fetch channels.')
-        else:
-            self.chan_json = result['entries']
-            # _LOGGER.debug(result)
+        await self._fetch_grid_list(GRID_CHANNELS)
 
     async def fetch_service_list(self):
         """Fetch service list"""
-        result = await self.api_get(self.root_url + SERVICES_URL, {'start': '0', 'limit': '999999999'})
+        await self._fetch_grid_list(GRID_SERVICES)
+
+    async def fetch_mux_list(self):
+        """Fetch mux list"""
+        await self._fetch_grid_list(GRID_MUXES)
+
+    async def _fetch_grid_list(self, grid):
+        """Fetch a grid, indexing entries as they are read."""
+        path, fields, record = _GRID_SOURCES[grid]
+        attr, _, names, add, _ = _GRID_INDEXES[grid]
+        indexer = getattr(self, add)
+        lookups = tuple({} for _ in names)
+        if not getattr(self, names[0]):
+            # Nothing loaded yet, make entries available as they arrive
+            self._set_lookups(grid, lookups)
+
+        def add_entry(entry):
+            """Index entry as it is read."""
+            item = self._make_record(record, entry)
+            if item is not None:
+                indexer(*lookups, item)
+            return item
+
+        result = await self.fetch_grid(self.root_url + path, fields, add_entry)
         if result is None:
-            _LOGGER.error('Unable to fetch services.')
-        else:
-            self.serv_json = result['entries']
-            # _LOGGER.debug(result)
+            _LOGGER.error('Unable to fetch %s.', grid)
+        elif self._grid_changed(grid, result):
+            setattr(self, attr, result)
+            self._set_lookups(grid, lookups)
+            _LOGGER.debug('Indexed %s %s.', len(lookups[0]), grid)
 
-    def get_services(self, channel_name):
-        """Return list of service IDs based on channel name"""
-        if not self.chan_json:
-            return
+    def _set_lookups(self, grid, lookups):
+        """Replace the lookups of a grid."""
+        for name, lookup in zip(_GRID_INDEXES[grid][2], lookups):
+            setattr(self, name, lookup)
 
-        for chan in self.chan_json:
-            if chan['name'] == channel_name:
-                return chan['services']
+    async def fetch_input_list(self, max_age=0):
+        """Fetch tuned inputs and index the muxes they carry.
 
-    async def api_post(self, url, params=None, data=None):
-        """Make api post request."""
-        post = None
-        try:
-            with async_timeout.timeout(DEFAULT_TIMEOUT, loop=self._event_loop):
-                post = await self._api_session.post(
-                    url, params=params, data=data)
-            if post.status != 200:
-                _LOGGER.error('Error posting data: %s', post.status)
+        Inputs fetched less than max_age seconds ago are reused.
+        """
+        loop = self._event_loop
+        if max_age and self._inputs_fetched is not None and \
+                loop.time() - self._inputs_fetched < max_age:
+            return self._inputs
+
+        ilist = await self.api_get(self.root_url + INPUTS_URL)
+        if not isinstance(ilist, dict) or 'entries' not in ilist:
+            _LOGGER.error('Unable to fetch inputs.')
+            return None
+
+        mux_names = self._mux_name_index()
+        inputs = []
+        tuned = {}
+        for entry in ilist['entries']:
+            try:
+                inp = Input.from_entry(
+                    entry, mux_names.get(entry.get('stream')))
+            except (KeyError, TypeError) as err:
+                _LOGGER.debug('Error reading input: %s', err)
+                continue
+            inputs.append(inp)
+            if inp.mux_uuid is not None:
+                tuned.setdefault(inp.mux_uuid, []).append(inp)
+
+        self._inputs = inputs
+        self._tuned_muxes = tuned
+        self._inputs_fetched = loop.time()
+        self._observe_input_errors()
+        _LOGGER.debug('%s inputs streaming %s muxes.',
+                      len(inputs), len(tuned))
+        return inputs
+
+    def _mux_name_index(self):
+        """Return lookup of input stream names to mux uuid"""
+        if self._mux_names_source is self.mux_json:
+            return self._mux_names
+
+        names = {}
+        plain = {}
+        for mux in self.mux_json or []:
+            if not mux.name:
+                continue
+            names['{} in {}'.format(mux.name, mux.network)] = mux.uuid
+            names['{}/{}'.format(mux.network, mux.name)] = mux.uuid
+            plain.setdefault(mux.name, []).append(mux.uuid)
+        # Bare mux names only identify a mux if no other shares them
+        for name, uuids in plain.items():
+            if len(uuids) == 1:
+                names.setdefault(name, uuids[0])
+        self._mux_names = names
+        self._mux_names_source = self.mux_json
+        return names
+
+    def _observe_input_errors(self):
+        """Feed input error counters of active streams to the scheduler."""
+        for index in self._streams.values():
+            strm = self._ext_list[index]
+            inputs = self._tuned_muxes.get(strm.active_mux)
+            if not inputs:
+                continue
+            for service in strm.service_full_list:
+                if service.active:
+                    self._scheduler.record_errors(
+                        service.service_uuid,
+                        sum(inp.errors for inp in inputs), source='input')
+                    break
+
+    def get_mux_inputs(self, mux_uuid):
+        """Return list of inputs currently tuned to a mux"""
+        return self._tuned_muxes.get(mux_uuid, [])
+
+    async def fetch_stream_epg(self, max_age=EPG_MAX_AGE):
+        """Load programmes of active stream channels not loaded recently.
+
+        Slots whose current programme changed are signalled through
+        the update callback.
+        """
+        stale = []
+        for index in self._streams.values():
+            for uuid in self._ext_list[index].channel_uuids:
+                if self._epg.stale(uuid, max_age) and uuid not in stale:
+                    stale.append(uuid)
+        if stale:
+            await self.fetch_epg(stale)
+        self._epg.evict()
+
+        programmes = {}
+        for index in self._streams.values():
+            current = self._ext_list[index].now_next()[0]
+            programmes[index] = None if current is None else current.id
+            if programmes[index] != self._slot_programmes.get(index):
+                self._do_update_callback(index)
+        self._slot_programmes = programmes
+
+    async def fetch_epg(self, channel_uuids=None):
+        """Load programmes of channels, of every channel if None.
+
+        Returns number of programmes loaded, None if nothing loaded.
+        """
+        url = self.root_url + EPG_URL
+
+        def make_event(entry):
+            """Build event as it is read."""
+            return self._make_record(Event, entry)
+
+        if channel_uuids is None:
+            events = await self.fetch_grid(url, EPG_FIELDS, make_event)
+            if events is None:
+                _LOGGER.error('Unable to fetch programme guide.')
                 return None
+            self._epg.load(events, self._chan_uuid_index)
+            return len(events)
 
-            if 'text/x-json' in post.headers['content-type']:
-                post_result = await post.json(content_type='text/x-json')
-            else:
-                _LOGGER.debug('Response was not JSON, returning text.')
-                post_result = await post.text()
+        semaphore = asyncio.Semaphore(self._page_concurrency)
 
-            return post_result
+        async def fetch_channel(uuid):
+            """Fetch programmes of a single channel."""
+            async with semaphore:
+                return await self.fetch_grid(
+                    url, EPG_FIELDS, make_event, {'channel': uuid})
 
-        except (aiohttp.ClientError, asyncio.TimeoutError,
-                ConnectionRefusedError) as err:
-            _LOGGER.error('Error posting data. %s', err)
+        channel_uuids = list(channel_uuids)
+        results = await asyncio.gather(
+            *[fetch_channel(uuid) for uuid in channel_uuids])
+
+        loaded = []
+        events = []
+        for uuid, result in zip(channel_uuids, results):
+            if result is None:
+                _LOGGER.error('Unable to fetch programmes of %s.', uuid)
+                continue
+            loaded.append(uuid)
+            events.extend(result)
+        if not loaded:
             return None
+        self._epg.load(events, loaded)
+        return len(events)
 
-    async def api_get(self, url, params=None):
-        """Make api fetch request."""
-        request = None
-        headers = DEFAULT_HEADERS.copy()
-        # headers.update({'Session-Token': self._token})
+    async def fetch_grid(self, url, fields=None, factory=None, params=None):
+        """Fetch grid in pages, return list of entries"""
+        params = dict(params or {})
+        if not self._page_size:
+            grid = await self.api_get_grid(
+                url, fields, factory,
+                dict(params, start='0', limit='999999999'))
+            if grid is None:
+                return None
+            self._log_dropped(url, grid.count, grid.entries)
+            return grid.entries
 
-        try:
-            with async_timeout.timeout(DEFAULT_TIMEOUT, loop=self._event_loop):
-                request = await self._api_session.get(
-                    url, headers=headers, params=params)
-            # _LOGGER.debug('Get URL: %s', request.url)
-            if request.status != 200:
-                _LOGGER.error('Error fetching data: %s', request.status)
+        page_size = int(self._page_size)
+        first = await self.api_get_grid(
+            url, fields, factory,
+            dict(params, start='0', limit=str(page_size)))
+        if first is None:
+            return None
+
+        # A short page ends the grid, counted before malformed records
+        # are dropped
+        total = first.total
+        if total is None or first.count < page_size:
+            self._log_dropped(url, first.count, first.entries)
+            return first.entries
+
+        # Pull the remaining windows concurrently
+        semaphore = asyncio.Semaphore(self._page_concurrency)
+
+        async def fetch_page(start):
+            """Fetch a single window of the grid."""
+            async with semaphore:
+                return await self.api_get_grid(
+                    url, fields, factory,
+                    dict(params, start=str(start), limit=str(page_size)))
+
+        pages = await asyncio.gather(
+            *[fetch_page(start) for start in
+              range(page_size, int(total), page_size)])
+
+        entries = first.entries
+        count = first.count
+        for page in pages:
+            if page is None:
+                _LOGGER.error('Unable to fetch all pages of %s.', url)
+                return None
+            entries.extend(page.entries)
+            count += page.count
+        _LOGGER.debug('Fetched %s of %s entries in %s pages from %s',
+                      len(entries), total, len(pages) + 1, url)
+        self._log_dropped(url, count, entries)
+        return entries
+
+    @staticmethod
+    def _log_dropped(url, count, entries):
+        """Log grid records that could not be read."""
+        if count > len(entries):
+            _LOGGER.warning('Skipped %s malformed of %s entries from %s',
+                            count - len(entries), count, url)
+
+    async def refresh_nodes(self, grid, changed=(), deleted=()):
+        """Load grid entries by uuid and patch them in place.
+
+        Returns True if the grid changed, None if loading failed.
+        """
+        record = _GRID_SOURCES[grid][2]
+        deleted = set(deleted)
+        changed = [uuid for uuid in changed if uuid not in deleted]
+        upserts = []
+        if changed:
+            result = await self.api_post(
+                self.root_url + IDNODE_LOAD_URL, params=None,
+                data={'uuid': json.dumps(changed), 'grid': '1'}, retry=True)
+            if not isinstance(result, dict):
+                _LOGGER.error('Unable to load changed %s.', grid)
                 return None
 
-            if 'text/x-json' in request.headers['content-type']:
-                request_json = await request.json(content_type='text/x-json')
+            loaded = set()
+            for entry in result.get('entries', []):
+                loaded.add(entry.get('uuid'))
+                entry = self._make_record(record, entry)
+                if entry is not None:
+                    upserts.append(entry)
+            # Nodes that no longer load have been removed
+            deleted.update(uuid for uuid in changed if uuid not in loaded)
+
+        return self.patch_grid(grid, upserts, deleted)
+
+    async def refresh_grid_pages(self, grid):
+        """Refetch a grid, parsing only windows whose content changed.
+
+        Each window is hashed and compared with the previous refresh.
+        Returns True if the grid changed, None if it could not be fetched.
+        """
+        attr, lookup = self._grid_state(grid)[:2]
+        if getattr(self, attr) is None:
+            _LOGGER.debug('No %s loaded, not refreshing pages.', grid)
+            return None
+
+        path, fields, record = _GRID_SOURCES[grid]
+        url = self.root_url + path
+        limit = int(self._page_size) if self._page_size else 999999999
+        first = await self.api_get_raw(
+            url, {'start': '0', 'limit': str(limit)})
+        if first is None:
+            return None
+
+        semaphore = asyncio.Semaphore(self._page_concurrency)
+
+        async def fetch_page(start):
+            """Fetch a single window of the grid."""
+            async with semaphore:
+                return await self.api_get_raw(
+                    url, {'start': str(start), 'limit': str(limit)})
+
+        pages = [first] + await asyncio.gather(
+            *[fetch_page(start) for start in
+              range(limit, grid_total(first) or 0, limit)])
+        if any(page is None for page in pages):
+            _LOGGER.error('Unable to fetch all pages of %s.', url)
+            return None
+
+        def make_record(entry):
+            """Build record from a grid entry."""
+            return self._make_record(record, entry)
+
+        known = self._page_digests.get(grid, [])
+        digests = []
+        upserts = []
+        seen = set()
+        unchanged = 0
+        for pos, page in enumerate(pages):
+            digest = hashlib.sha1(page).hexdigest()
+            if pos < len(known) and known[pos][0] == digest:
+                uuids = known[pos][1]
+                unchanged += 1
             else:
-                _LOGGER.debug('Response was not JSON, returning text.')
-                request_json = await request.text()
+                reader = GridReader(fields, make_record)
+                try:
+                    reader.load(await self._decoder.decode_async(page))
+                except ValueError as err:
+                    _LOGGER.error('Error parsing %s page. %s', grid, err)
+                    return None
+                upserts.extend(reader.entries)
+                uuids = tuple(entry.uuid for entry in reader.entries)
+            seen.update(uuids)
+            digests.append((digest, uuids))
+
+        _LOGGER.debug('%s of %s %s pages changed.',
+                      len(pages) - unchanged, len(pages), grid)
+        self._page_digests[grid] = digests
+        return self.patch_grid(
+            grid, upserts, [uuid for uuid in lookup if uuid not in seen])
 
-            return request_json
+    async def refresh_changed_grids(self):
+        """Refresh all grids by page hash, patching changed entries."""
+        await asyncio.gather(
+            self.refresh_grid_pages(GRID_CHANNELS),
+            self.refresh_grid_pages(GRID_SERVICES),
+            self.refresh_grid_pages(GRID_MUXES))
 
-        except (aiohttp.ClientError, asyncio.TimeoutError,
-                ConnectionRefusedError) as err:
-            _LOGGER.error('Error fetching data. %s', err)
+    def _grid_state(self, grid):
+        """Return entry attribute, uuid lookup, lookups and indexers"""
+        attr, uuids, names, add, remove = _GRID_INDEXES[grid]
+        return (attr, getattr(self, uuids),
+                tuple(getattr(self, name) for name in names),
+                getattr(self, add), getattr(self, remove))
+
+    def patch_grid(self, grid, upserts=(), deleted=()):
+        """Replace, add and remove grid entries in place.
+
+        Lookups are patched rather than rebuilt and only streams using
+        a touched entry are refreshed.  Returns True if anything changed.
+        """
+        attr, lookup, indexes, add, remove = self._grid_state(grid)
+        if getattr(self, attr) is None:
+            _LOGGER.debug('No %s loaded, not patching.', grid)
+            return False
+
+        touched = []
+        for uuid in deleted:
+            old = lookup.get(uuid)
+            if old is not None:
+                remove(*indexes, old)
+                touched.append(old)
+        for entry in upserts:
+            old = lookup.get(entry.uuid)
+            if old == entry:
+                continue
+            if old is not None:
+                remove(*indexes, old)
+                touched.append(old)
+            add(*indexes, entry)
+            touched.append(entry)
+        if not touched:
+            return False
+
+        setattr(self, attr, list(lookup.values()))
+        self._mark_grid_dirty(grid)
+        _LOGGER.debug('Patched %s %s entries.', len(touched), grid)
+        self._refresh_stream_info(self._affected_streams(grid, touched))
+        return True
+
+    def _affected_streams(self, grid, entries):
+        """Return indexes of active streams using any of the entries"""
+        if grid == GRID_CHANNELS:
+            names = {chan.name.upper() for chan in entries}
+        else:
+            uuids = {entry.uuid for entry in entries}
+
+        indexes = []
+        for index in self._streams.values():
+            strm = self._ext_list[index]
+            if grid == GRID_CHANNELS:
+                used = strm.channel_name.upper() in names
+            elif grid == GRID_SERVICES:
+                used = any(
+                    service.service_uuid in uuids
+                    for service in strm.service_full_list) or any(
+                        uuids.intersection(chan.services) for chan
+                        in self.get_channels(strm.channel_name))
+            else:
+                used = any(service.mux_uuid in uuids
+                           for service in strm.service_full_list)
+            if used:
+                indexes.append(index)
+        return indexes
+
+    @staticmethod
+    def _make_record(record, entry):
+        """Return record built from grid entry, None if malformed"""
+        try:
+            return record.from_entry(entry)
+        except (KeyError, AttributeError, TypeError) as err:
+            _LOGGER.debug('Error reading %s: %s', record.__name__, err)
             return None
 
+    @staticmethod
+    def _index_channel(chan_index, chan_uuids, chan):
+        """Add a channel to the channel name and uuid lookups"""
+        chan_index.setdefault(chan.name.upper(), []).append(chan)
+        chan_uuids[chan.uuid] = chan
+
+    @staticmethod
+    def _unindex_channel(chan_index, chan_uuids, chan):
+        """Remove a channel from the channel name and uuid lookups"""
+        _discard(chan_index, chan.name.upper(), chan)
+        chan_uuids.pop(chan.uuid, None)
+
+    @staticmethod
+    def _index_service(serv_index, mux_services, network_services, serv):
+        """Add a service to the service, mux and network lookups"""
+        serv_index[serv.uuid] = serv
+        mux_services.setdefault(serv.mux_uuid, []).append(serv)
+        network_services.setdefault(serv.network, []).append(serv)
+
+    @staticmethod
+    def _unindex_service(serv_index, mux_services, network_services, serv):
+        """Remove a service from the service, mux and network lookups"""
+        serv_index.pop(serv.uuid, None)
+        _discard(mux_services, serv.mux_uuid, serv)
+        _discard(network_services, serv.network, serv)
+
+    @staticmethod
+    def _index_mux(mux_index, mux):
+        """Add a mux to the mux lookup"""
+        mux_index[mux.uuid] = mux
+
+    @staticmethod
+    def _unindex_mux(mux_index, mux):
+        """Remove a mux from the mux lookup"""
+        mux_index.pop(mux.uuid, None)
+
+    def build_channel_index(self):
+        """Build channel name lookup from channel grid"""
+        self._build_grid_index(GRID_CHANNELS)
+
+    def build_mux_index(self):
+        """Build mux lookup from mux grid"""
+        self._build_grid_index(GRID_MUXES)
+
+    def build_service_index(self):
+        """Build service, mux and network lookups from service grid"""
+        self._build_grid_index(GRID_SERVICES)
+
+    def _build_grid_index(self, grid):
+        """Rebuild the lookups of a grid from its entries."""
+        attr, _, names, add, _ = _GRID_INDEXES[grid]
+        indexer = getattr(self, add)
+        lookups = tuple({} for _ in names)
+        for item in getattr(self, attr) or []:
+            indexer(*lookups, item)
+        self._set_lookups(grid, lookups)
+        _LOGGER.debug('Indexed %s %s.', len(lookups[0]), grid)
+
+    def get_channels(self, channel_name):
+        """Return list of channels matching channel name"""
+        if not channel_name:
+            return []
+        return self._chan_index.get(channel_name.upper(), [])
+
+    def get_service(self, service_uuid):
+        """Return service based on service uuid"""
+        return self._serv_index.get(service_uuid)
+
+    def get_mux(self, mux_uuid):
+        """Return mux based on mux uuid"""
+        return self._mux_index.get(mux_uuid)
+
+    def get_mux_services(self, mux_uuid):
+        """Return list of services carried on a mux"""
+        return self._mux_services.get(mux_uuid, [])
+
+    def get_network_services(self, network):
+        """Return list of services on a network"""
+        if not network:
+            return []
+        return self._network_services.get(network.upper(), [])
+
+    def get_services(self, channel_name):
+        """Return list of service IDs based on channel name"""
+        channels = self.get_channels(channel_name)
+        if not channels:
+            return
+
+        return channels[0].services
+
+    async def api_post(self, url, params=None, data=None, retry=False,
+                       breaker=True):
+        """Make api post request, retried only if retry is set."""
+        return await self._request(
+            'post', url, self._read_result, params=params, data=data,
+            retry=retry, breaker=breaker)
+
+    async def api_get(self, url, params=None):
+        """Make api fetch request."""
+        return await self._request(
+            'get', url, self._read_result, params=params, retry=True)
+
+    async def api_get_grid(self, url, fields=None, factory=None,
+                           params=None):
+        """Make streaming api fetch request, return grid reader."""
+        async def read_grid(response):
+            """Parse grid as it streams in, or whole with a fast decoder."""
+            reader = GridReader(fields, factory)
+            if self._decoder.streaming:
+                await reader.read(response.content)
+            else:
+                reader.load(await self._decoder.decode_async(
+                    await response.read()))
+            return reader
+
+        return await self._request(
+            'get', url, read_grid, params=params, retry=True)
+
+    async def api_get_raw(self, url, params=None):
+        """Make api fetch request, return response body as bytes."""
+        return await self._request(
+            'get', url, self._read_raw, params=params, retry=True)
+
     async def api_put(self, url, data=None):
         """Make api put request."""
-        put = None
-        headers = DEFAULT_HEADERS.copy()
-        # headers.update({'Session-Token': self._token})
+        return await self._request(
+            'put', url, self._read_result, data=data, retry=True)
 
-        try:
-            with async_timeout.timeout(DEFAULT_TIMEOUT, loop=self._event_loop):
-                put = await self._api_session.put(
-                    url, headers=headers, data=data)
-            if put.status != 200:
-                _LOGGER.error('Error putting data: %s', put.status)
+    async def _read_result(self, response):
+        """Return decoded JSON body, or text if not JSON."""
+        if 'text/x-json' in response.headers.get('content-type', ''):
+            return await self._decoder.decode_async(await response.read())
+        _LOGGER.debug('Response was not JSON, returning text.')
+        return await response.text()
+
+    @staticmethod
+    async def _read_raw(response):
+        """Return body as bytes."""
+        return await response.read()
+
+    async def _request(self, method, url, reader, params=None, data=None,
+                       retry=False, breaker=True):
+        """Make api request, return result of reader or None on failure.
+
+        Failures before the body is read are retried with jittered
+        exponential backoff if retry is set.  Repeated failures open the
+        circuit breaker, which rejects requests until a probe succeeds.
+        """
+        path = urlsplit(str(url)).path
+        timeout = self._timeouts.get(path, DEFAULT_TIMEOUT)
+        attempts = self._retries if retry else 1
+
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, min(
+                    RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+            if breaker and not self._breaker.allow():
+                _LOGGER.debug('Circuit open, not requesting %s.', path)
+                if self._metrics is not None:
+                    self._metrics.count('requests_rejected')
                 return None
 
-            if 'text/x-json' in put.headers['content-type']:
-                put_result = await put.json(content_type='text/x-json')
-            else:
-                _LOGGER.debug('Response was not JSON, returning text.')
-                put_result = await put.text()
+            last = attempt == attempts - 1
+            response = None
+            reading = False
+            start = self._event_loop.time()
+            try:
+                with async_timeout.timeout(timeout, loop=self._event_loop):
+                    response = await self._api_session.request(
+                        method, url, params=params, data=data,
+                        headers=DEFAULT_HEADERS, **self._auth_kwargs)
+                    if response.status != 200:
+                        self._request_failed(url)
+                        if response.status not in RETRY_STATUSES:
+                            # Answered, just not what we asked for
+                            self._breaker.success()
+                            _LOGGER.error('Error requesting %s: %s',
+                                          path, response.status)
+                            return None
+                        self._request_error(
+                            last, 'Error requesting %s: %s',
+                            path, response.status)
+                        continue
 
-            return put_result
+                    reading = True
+                    result = await reader(response)
 
-        except (aiohttp.ClientError, asyncio.TimeoutError,
-                ConnectionRefusedError) as err:
-            _LOGGER.error('Error putting data. %s', err)
-            return None
+                self._breaker.success()
+                self._observe_request(url, start, response)
+                return result
+
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ConnectionRefusedError) as err:
+                self._request_failed(url, err)
+                # A partly read body may have been consumed, never retry it
+                self._request_error(last or reading,
+                                    'Error requesting %s. %s', path, err)
+                if reading:
+                    return None
+            except ValueError as err:
+                self._request_failed(url, err)
+                self._breaker.success()
+                _LOGGER.error('Error parsing %s. %s', path, err)
+                return None
+            finally:
+                if response is not None:
+                    response.release()
+        return None
+
+    def _request_error(self, last, msg, *args):
+        """Count a failure towards the breaker, log it if not retrying."""
+        if self._breaker.failure() and self._metrics is not None:
+            self._metrics.count('breaker_opened')
+        if last:
+            _LOGGER.error(msg, *args)
+        else:
+            _LOGGER.debug(msg + ', retrying.', *args)
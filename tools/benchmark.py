@@ -0,0 +1,181 @@
+"""
+tools.benchmark
+~~~~~~~~~~~~~~~~~~~~
+Benchmark pytvheadend against the local stand-in server at several
+grid sizes and write the results as JSON.
+
+Run with:  python tools/benchmark.py --scales 100 1000 10000 -o bench.json
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+# pylint: disable=wrong-import-position
+from pytvheadend.constants import __version__  # noqa: E402
+from pytvheadend.records import Subscription  # noqa: E402
+from pytvheadend.tvheadend import TVHeadend  # noqa: E402
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'tvh_standin.py')
+
+DEFAULT_SCALES = [100, 1000, 10000, 100000]
+SUBSCRIPTIONS = 8
+POLL_ROUNDS = 50
+UPDATE_ROUNDS = 2000
+INFO_ROUNDS = 200
+SWITCH_ROUNDS = 3
+
+
+def free_port():
+    """Return a free local tcp port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(port, timeout=120):
+    """Wait until the stand-in server answers."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get('http://127.0.0.1:{}/api/status/'
+                                       'subscriptions'.format(port)):
+                    return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+
+async def bench_scale(scale, args):
+    """Run all measurements against a server of the given size."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, STANDIN, '--port', str(port),
+         '--channels', str(scale), '--subscriptions', str(SUBSCRIPTIONS),
+         '--switch-delay', str(args.switch_delay), '--no-comet'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {'scale': scale}
+    try:
+        await wait_for_server(port)
+        loop = asyncio.get_event_loop()
+
+        # Cold start peak memory, traced separately as tracing is slow
+        tracemalloc.start()
+        tvh = TVHeadend('127.0.0.1', port, maxconn=SUBSCRIPTIONS, loop=loop)
+        await tvh.start()
+        result['start_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        await tvh.stop()
+
+        # Cold start: grid download, parse and indexing
+        begin = time.perf_counter()
+        tvh = TVHeadend('127.0.0.1', port, maxconn=SUBSCRIPTIONS, loop=loop)
+        await tvh.start()
+        result['start_seconds'] = time.perf_counter() - begin
+        result['channels'] = len(tvh.chan_json or [])
+        result['services'] = len(tvh.serv_json or [])
+
+        # Subscription poll round-trip
+        begin = time.perf_counter()
+        for _ in range(POLL_ROUNDS):
+            await tvh.fetch_subscription_list()
+        result['polls_per_second'] = \
+            POLL_ROUNDS / (time.perf_counter() - begin)
+
+        # Diffing alone, alternating the network of every stream
+        subs = tvh.active_subscriptions
+        moved = [Subscription(sub.id, sub.name, sub.network + ' X')
+                 for sub in subs]
+        begin = time.perf_counter()
+        for rounds in range(UPDATE_ROUNDS):
+            tvh.update_stream_list(moved if rounds % 2 else subs)
+        result['updates_per_second'] = \
+            UPDATE_ROUNDS / (time.perf_counter() - begin)
+        # Clear the slots so the fake moves do not linger in history
+        tvh.update_stream_list([])
+        tvh.update_stream_list(subs)
+
+        # Service option lookup for every active stream
+        streams = [strm for strm in tvh.stream_list if strm.is_active]
+        begin = time.perf_counter()
+        for _ in range(INFO_ROUNDS):
+            for strm in streams:
+                strm.get_channel_info()
+        calls = INFO_ROUNDS * max(1, len(streams))
+        result['channel_info_us'] = \
+            (time.perf_counter() - begin) / calls * 1e6
+
+        # Switch end-to-end, including the settle wait
+        times = []
+        for _ in range(SWITCH_ROUNDS):
+            if not streams[0].is_active:
+                break
+            begin = time.perf_counter()
+            await streams[0].change_service()
+            times.append(time.perf_counter() - begin)
+        if times:
+            result['change_service_seconds'] = sum(times) / len(times)
+
+        await tvh.stop()
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+async def run(args):
+    """Benchmark every requested scale."""
+    results = []
+    for scale in args.scales:
+        print('Benchmarking {} channels...'.format(scale), file=sys.stderr)
+        results.append(await bench_scale(scale, args))
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'aiohttp': aiohttp.__version__,
+        'timestamp': time.time(),
+        'results': results,
+        }
+
+
+def main():
+    """Run benchmarks from the command line."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark pytvheadend against a stand-in server.')
+    parser.add_argument('--scales', type=int, nargs='+',
+                        default=DEFAULT_SCALES,
+                        help='Channel counts to benchmark.')
+    parser.add_argument('--switch-delay', type=float, default=0.5,
+                        help='Seconds a service switch takes on the server.')
+    parser.add_argument('-o', '--output',
+                        help='Write JSON results to this file.')
+    args = parser.parse_args()
+
+    report = asyncio.get_event_loop().run_until_complete(run(args))
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
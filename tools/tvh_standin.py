@@ -0,0 +1,435 @@
+"""
+tools.tvh_standin
+~~~~~~~~~~~~~~~~~~~~
+Local stand-in for a TVHeadend server, for exercising pytvheadend
+without a headend.  Serves synthetic channel, service and mux grids,
+the subscription and input status lists, idnode/save service switching and the
+idnode/load, programme guide and the comet notification endpoints
+(websocket and long-poll).
+
+Run with:  python tools/tvh_standin.py --port 9981 --channels 1000 --demo
+Copyright (c) 2019 John Mihalic <https://github.com/mezz64>
+Licensed under the MIT license.
+
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+from aiohttp import web
+
+_LOGGER = logging.getLogger(__name__)
+
+# Matches the long-poll hold time of a real server
+POLL_HOLD = 10
+
+# Channels sharing a mux on each network
+CHANNELS_PER_MUX = 10
+
+# Synthetic programme guide, half hour programmes for a day ahead
+PROGRAMME_LENGTH = 1800
+EPG_HOURS = 24
+
+# Bytes per second delivered by every subscription
+STREAM_BYTE_RATE = 1000000
+
+
+class StandinServer(object):
+    """Fake TVHeadend server state and web application"""
+    def __init__(self, websocket=True, comet=True, switch_delay=0.5):
+        """Initialize stand-in server."""
+        self.switch_delay = switch_delay
+        # Networks a subscription never manages to switch to
+        self.dead_networks = set()
+        # Number of upcoming api requests answered as overloaded
+        self.overloaded = 0
+        self.channels = []
+        self.services = {}
+        self.service_list = []
+        self.muxes = []
+        self._channel_names = {}
+
+        self.subscriptions = {}
+        self._next_id = 1
+        self._mailboxes = {}
+        self._next_box = 1
+        self._sockets = set()
+
+        self.app = web.Application(middlewares=[self.overload_middleware])
+        self.app.router.add_route(
+            '*', '/api/status/subscriptions', self.handle_subscriptions)
+        self.app.router.add_route(
+            '*', '/api/status/inputs', self.handle_inputs)
+        self.app.router.add_route(
+            '*', '/api/channel/grid', self.grid_handler(self.channels))
+        self.app.router.add_route(
+            '*', '/api/mpegts/mux/grid', self.grid_handler(self.muxes))
+        self.app.router.add_route(
+            '*', '/api/mpegts/service/grid',
+            self.grid_handler(self.service_list))
+        self.app.router.add_route(
+            '*', '/api/epg/events/grid', self.handle_epg)
+        self.app.router.add_post('/api/idnode/save', self.handle_save)
+        self.app.router.add_post('/api/idnode/load', self.handle_load)
+        if comet:
+            self.app.router.add_post('/comet/poll', self.handle_comet_poll)
+            if websocket:
+                self.app.router.add_get('/comet/ws', self.handle_comet_ws)
+
+    @web.middleware
+    async def overload_middleware(self, request, handler):
+        """Answer api requests with 503 while overloaded."""
+        if self.overloaded > 0 and request.path.startswith('/api/'):
+            self.overloaded -= 1
+            return web.Response(status=503, text='Overloaded')
+        return await handler(request)
+
+    @staticmethod
+    def json_response(data):
+        """Return response the way TVHeadend sends JSON."""
+        return web.Response(
+            text=json.dumps(data), content_type='text/x-json')
+
+    def populate(self, channels, services_per_channel=3, networks=3):
+        """Generate synthetic channel, service and mux grids."""
+        networks = ['NETWORK {}'.format(num) for num in range(networks)]
+        muxes = {}
+        for num in range(channels):
+            chan = {
+                'uuid': 'chan{:08x}'.format(num),
+                'name': 'Channel {}'.format(num),
+                'number': num + 1,
+                'enabled': True,
+                'icon': 'picon://1_0_1_{:X}_0_0.png'.format(num),
+                'tags': ['tag0'],
+                'services': [],
+                }
+            for pos in range(services_per_channel):
+                network = networks[(num + pos) % len(networks)]
+                mux_key = (network, num // CHANNELS_PER_MUX)
+                if mux_key not in muxes:
+                    muxes[mux_key] = {
+                        'uuid': 'mux{:08x}'.format(len(muxes)),
+                        'name': '{} MHz'.format(474 + 8 * len(muxes)),
+                        'network': network,
+                        'enabled': True,
+                        }
+                serv = {
+                    'uuid': 'serv{:08x}'.format(len(self.services)),
+                    'network': network,
+                    'multiplex': muxes[mux_key]['name'],
+                    'multiplex_uuid': muxes[mux_key]['uuid'],
+                    'svcname': chan['name'],
+                    'channel': [chan['uuid']],
+                    'enabled': True,
+                    'sid': num,
+                    }
+                self.services[serv['uuid']] = serv
+                self.service_list.append(serv)
+                chan['services'].append(serv['uuid'])
+            self.channels.append(chan)
+            self._channel_names[chan['name'].upper()] = chan
+        self.muxes.extend(muxes.values())
+
+    def add_channel(self, name, network):
+        """Add a channel with one service on an existing mux."""
+        mux = next(mux for mux in self.muxes if mux['network'] == network)
+        chan = {
+            'uuid': 'chan{:08x}'.format(len(self.channels) + 0x10000000),
+            'name': name,
+            'enabled': True,
+            'services': [],
+            }
+        serv = {
+            'uuid': 'serv{:08x}'.format(len(self.services) + 0x10000000),
+            'network': network,
+            'multiplex': mux['name'],
+            'multiplex_uuid': mux['uuid'],
+            'svcname': name,
+            'channel': [chan['uuid']],
+            'enabled': True,
+            }
+        self.services[serv['uuid']] = serv
+        self.service_list.append(serv)
+        chan['services'].append(serv['uuid'])
+        self.channels.append(chan)
+        self._channel_names[name.upper()] = chan
+        self.notify({'notificationClass': 'service',
+                     'create': [serv['uuid']]})
+        self.notify({'notificationClass': 'channel',
+                     'create': [chan['uuid']]})
+        return chan['uuid']
+
+    def remove_channel(self, name):
+        """Remove a channel, keeping its services."""
+        chan = self._channel_names.pop(name.upper())
+        self.channels.remove(chan)
+        self.notify({'notificationClass': 'channel',
+                     'delete': [chan['uuid']]})
+
+    def subscribe(self, channel):
+        """Subscribe to a channel on its first enabled service."""
+        serv = self._enabled_service(self._channel_names[channel.upper()])
+        return self.add_subscription(channel, serv['network'])
+
+    def _enabled_service(self, chan, exclude=None):
+        """Return first enabled service of a channel."""
+        for uuid in chan['services']:
+            serv = self.services[uuid]
+            if serv['enabled'] and serv['network'] != exclude:
+                return serv
+        return None
+
+    def add_subscription(self, channel, network):
+        """Start a subscription, return its id."""
+        sub_id = self._next_id
+        self._next_id += 1
+        self.subscriptions[sub_id] = {
+            'id': sub_id,
+            'channel': channel,
+            'service': 'Adapter/{}/{}'.format(network, channel),
+            'state': 'Running',
+            'errors': 0,
+            'start': time.time(),
+            'total_in': 0,
+            'total_out': 0,
+            }
+        self.notify({'notificationClass': 'subscriptions', 'reload': 1})
+        return sub_id
+
+    def change_network(self, sub_id, network):
+        """Move a subscription to another network."""
+        sub = self.subscriptions[sub_id]
+        sub['service'] = 'Adapter/{}/{}'.format(network, sub['channel'])
+        msg = {'notificationClass': 'subscriptions', 'updateEntry': 1}
+        msg.update(sub)
+        self.notify(msg)
+
+    def remove_subscription(self, sub_id):
+        """Stop a subscription."""
+        self.subscriptions.pop(sub_id, None)
+        self.notify({'notificationClass': 'subscriptions', 'reload': 1})
+
+    def notify(self, msg):
+        """Queue a notification for every listener."""
+        for mailbox in self._mailboxes.values():
+            mailbox.put_nowait(msg)
+        for socket in self._sockets:
+            asyncio.ensure_future(
+                socket.send_str(json.dumps({'messages': [msg]})))
+
+    async def handle_subscriptions(self, request):
+        """Serve /api/status/subscriptions."""
+        now = time.time()
+        for sub in self.subscriptions.values():
+            sub['total_in'] = int((now - sub['start']) * STREAM_BYTE_RATE)
+            sub['total_out'] = sub['total_in']
+        entries = list(self.subscriptions.values())
+        return self.json_response({'entries': entries,
+                                   'totalCount': len(entries)})
+
+    async def handle_inputs(self, request):
+        """Serve /api/status/inputs, one input per tuned mux."""
+        muxes = {mux['uuid']: mux for mux in self.muxes}
+        tuned = {}
+        for sub in self.subscriptions.values():
+            chan = self._channel_names.get(sub['channel'].upper())
+            network = sub['service'].split('/')[1]
+            for uuid in chan['services'] if chan else ():
+                serv = self.services[uuid]
+                if serv['network'] == network:
+                    tuned.setdefault(serv['multiplex_uuid'], []).append(sub)
+                    break
+
+        entries = []
+        for num, (mux_uuid, subs) in enumerate(sorted(tuned.items())):
+            mux = muxes[mux_uuid]
+            entries.append({
+                'uuid': 'input{:04x}'.format(num),
+                'input': 'Adapter #{}'.format(num),
+                'stream': '{} in {}'.format(mux['name'], mux['network']),
+                'subs': len(subs),
+                'weight': 100,
+                'signal': 60000,
+                'snr': 30000,
+                'cc': sum(sub['errors'] for sub in subs),
+                'te': 0,
+                })
+        return self.json_response({'entries': entries,
+                                   'totalCount': len(entries)})
+
+    def grid_handler(self, entries):
+        """Return handler serving a paged grid."""
+        async def handle_grid(request):
+            """Serve a grid window."""
+            start = int(request.query.get('start', 0))
+            limit = int(request.query.get('limit', len(entries)))
+            return self.json_response({
+                'entries': entries[start:start + limit],
+                'total': len(entries)})
+        return handle_grid
+
+    def programmes(self, chan, now):
+        """Return synthetic programmes of a channel from now on."""
+        num = self.channels.index(chan)
+        first = int(now) // PROGRAMME_LENGTH * PROGRAMME_LENGTH
+        events = []
+        for slot in range(EPG_HOURS * 3600 // PROGRAMME_LENGTH):
+            start = first + slot * PROGRAMME_LENGTH
+            events.append({
+                'eventId': num * 100000 + start // PROGRAMME_LENGTH % 100000,
+                'channelUuid': chan['uuid'],
+                'channelName': chan['name'],
+                'start': start,
+                'stop': start + PROGRAMME_LENGTH,
+                'title': '{} programme {}'.format(chan['name'], slot),
+                'subtitle': 'Episode {}'.format(start // PROGRAMME_LENGTH),
+                })
+        return events
+
+    async def handle_epg(self, request):
+        """Serve /api/epg/events/grid, optionally for one channel."""
+        channel = request.query.get('channel')
+        now = time.time()
+        entries = []
+        for chan in self.channels:
+            if channel in (None, chan['uuid'], chan['name']):
+                entries.extend(self.programmes(chan, now))
+        entries.sort(key=lambda entry: entry['start'])
+        start = int(request.query.get('start', 0))
+        limit = int(request.query.get('limit', len(entries)))
+        return self.json_response({
+            'entries': entries[start:start + limit],
+            'totalCount': len(entries)})
+
+    async def handle_save(self, request):
+        """Serve /api/idnode/save, moving streams off disabled services."""
+        data = await request.post()
+        for node in json.loads(data['node']):
+            serv = self.services.get(node['uuid'])
+            if serv is not None and 'enabled' in node:
+                serv['enabled'] = node['enabled'] in (True, 'true', 1)
+
+        for sub_id, sub in self.subscriptions.items():
+            chan = self._channel_names.get(sub['channel'].upper())
+            network = sub['service'].split('/')[1]
+            if chan is None or self._enabled_service(chan) is None:
+                continue
+            current = [self.services[uuid] for uuid in chan['services']
+                       if self.services[uuid]['network'] == network]
+            if current and not current[0]['enabled']:
+                new = self._enabled_service(chan, exclude=network)
+                if new is None or new['network'] in self.dead_networks:
+                    continue
+                asyncio.get_event_loop().call_later(
+                    self.switch_delay, self._switch, sub_id, new['network'])
+        return self.json_response({})
+
+    async def handle_load(self, request):
+        """Serve /api/idnode/load for grid entries by uuid."""
+        data = await request.post()
+        uuids = set(json.loads(data['uuid']))
+        entries = [entry for grid in (self.channels, self.service_list,
+                                      self.muxes)
+                   for entry in grid if entry['uuid'] in uuids]
+        return self.json_response({'entries': entries})
+
+    def _switch(self, sub_id, network):
+        """Complete a delayed service switch."""
+        if sub_id in self.subscriptions:
+            self.change_network(sub_id, network)
+
+    async def handle_comet_poll(self, request):
+        """Serve /comet/poll."""
+        data = await request.post()
+        boxid = data.get('boxid')
+        if boxid not in self._mailboxes:
+            boxid = str(self._next_box)
+            self._next_box += 1
+            self._mailboxes[boxid] = asyncio.Queue()
+        mailbox = self._mailboxes[boxid]
+
+        messages = []
+        if data.get('immediate') != '1' and mailbox.empty():
+            try:
+                messages.append(
+                    await asyncio.wait_for(mailbox.get(), POLL_HOLD))
+            except asyncio.TimeoutError:
+                pass
+        while not mailbox.empty():
+            messages.append(mailbox.get_nowait())
+        return self.json_response({'boxid': boxid, 'messages': messages})
+
+    async def handle_comet_ws(self, request):
+        """Serve /comet/ws."""
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self._sockets.add(socket)
+        try:
+            async for _ in socket:
+                pass
+        finally:
+            self._sockets.discard(socket)
+        return socket
+
+
+async def demo(server, interval):
+    """Randomly start, switch and stop subscriptions."""
+    channels = [chan['name'] for chan in server.channels[:5]]
+    networks = sorted({mux['network'] for mux in server.muxes})
+    while True:
+        await asyncio.sleep(interval)
+        action = random.random()
+        if action < 0.4 or not server.subscriptions:
+            server.add_subscription(
+                random.choice(channels), random.choice(networks))
+        elif action < 0.7:
+            server.change_network(
+                random.choice(list(server.subscriptions)),
+                random.choice(networks))
+        else:
+            server.remove_subscription(
+                random.choice(list(server.subscriptions)))
+
+
+def main():
+    """Run stand-in server from the command line."""
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for a TVHeadend server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9981)
+    parser.add_argument('--no-websocket', action='store_true',
+                        help='Only offer comet long-poll.')
+    parser.add_argument('--no-comet', action='store_true',
+                        help='Offer no push notifications at all.')
+    parser.add_argument('--demo', type=float, nargs='?', const=5.0,
+                        help='Churn subscriptions every N seconds.')
+    parser.add_argument('--channels', type=int, default=100)
+    parser.add_argument('--services-per-channel', type=int, default=3)
+    parser.add_argument('--networks', type=int, default=3)
+    parser.add_argument('--subscriptions', type=int, default=0,
+                        help='Subscribe to this many channels at start.')
+    parser.add_argument('--switch-delay', type=float, default=0.5,
+                        help='Seconds a service switch takes.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StandinServer(websocket=not args.no_websocket,
+                           comet=not args.no_comet,
+                           switch_delay=args.switch_delay)
+    server.populate(args.channels, args.services_per_channel, args.networks)
+    for num in range(min(args.subscriptions, args.channels)):
+        server.subscribe('Channel {}'.format(num))
+    if args.demo:
+        async def start_demo(app):
+            """Start churn task with the application."""
+            app['demo'] = asyncio.ensure_future(demo(server, args.demo))
+        server.app.on_startup.append(start_demo)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()